@@ -1,8 +1,12 @@
+import collections
 import datetime
 import os
+import subprocess
+import threading
+import time
 import pdfkit
 from dotenv import load_dotenv
-from settings import DEBUG
+from settings import DEBUG, PDF_WORKERS, PDF_TIMEOUT
 from servise import printer
 from icecream import ic
 from settings import downloads_dir_absolute
@@ -14,11 +18,15 @@ load_dotenv()
 # https://thepythoncode.com/article/convert-html-to-pdf-in-python#html-file-to-pdf
 # https://html2pdf.com/ru/
 
-def converter(page_index, header_index, footer_index):
-    options = {
+def pdf_options(header_index, footer_index):
+    """Параметры wkhtmltopdf для отчёта с заданными заголовком и подвалом."""
+    return {
         'print-media-type': None,  # Печать с разрывом страницы
         "enable-local-file-access": "",
         "images": "",
+        # Шаблоны не используют скриптов и ресурсов из сети (стили и иконки встроены в HTML),
+        # поэтому JavaScript отключён: wkhtmltopdf не ждёт выполнения скриптов перед вёрсткой
+        'disable-javascript': None,
         'page-size': 'A4',
         # 'orientation': 'Landscape', # Альбомная ориентация
         'margin-top': '0.60in',
@@ -41,25 +49,113 @@ def converter(page_index, header_index, footer_index):
         # 'footer-right': f'Создано при помощи\n{os.getenv("TELEGRAM_BOT_USERNAME")}',
     }
 
+
+def wkhtmltopdf_configuration():
+    debag = os.getenv("DEBUG", False)
+    if debag:  # Режим отладки windows 11
+        return pdfkit.configuration(wkhtmltopdf=r'c:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
+    # Рабочий режим в linux
+    return pdfkit.configuration(wkhtmltopdf=r'/usr/bin/wkhtmltopdf')
+
+
+# PDF, собранный в памяти: имя файла для Telegram, содержимое, путь в архиве (None, если архив выключен)
+# и ключ в кэше отчётов report_cache
+RenderedReport = collections.namedtuple('RenderedReport', 'file_name pdf path key')
+
+
+def report_title(name='kriss_real_estate_bot'):
+    """Имя файла PDF отчёта: kriss_real_estate_bot_<время>.pdf."""
+    return f'{name}_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.pdf'
+
+
+def report_pdf_path(page_index):
+    """Путь к PDF отчёта рядом с его HTML: downloads/<cian_number>/kriss_real_estate_bot_<время>.pdf."""
+    return os.path.join(os.path.split(page_index)[0], report_title())
+
+
+def pdf_command(page_index, header_index, footer_index, output_path=None):
+    """
+    Командная строка wkhtmltopdf (список аргументов), которую собирает pdfkit.
+    Без page_index HTML читается из stdin, без output_path PDF пишется в stdout.
+    """
+    source, source_type = (page_index, 'file') if page_index else ('', 'string')
+    return pdfkit.PDFKit(source, source_type, options=pdf_options(header_index, footer_index),
+                         configuration=wkhtmltopdf_configuration()).command(output_path)
+
+
+def read_head(path, size=4):
+    """Первые байты файла (b'' если его нет) - для check_pdf()."""
     try:
-        report_title = f'kriss_real_estate_bot_{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}.pdf'
-        RESULT_PDF = os.path.join(os.path.split(page_index)[0], report_title)
-        debag = os.getenv("DEBUG", False)
-        printer(f'[converter] Режим отладки: {debag}', kind='info')
-        if debag: # Режим отладки windows 11
-            config = pdfkit.configuration(wkhtmltopdf=r'c:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
-        else: # Рабочий режим в linux
-            config = pdfkit.configuration(wkhtmltopdf=r'/usr/bin/wkhtmltopdf')
-        pdfkit.from_file(page_index, RESULT_PDF, configuration=config, options=options)
+        with open(path, mode='rb') as f:
+            return f.read(size)
+    except OSError:
+        return b''
+
+
+def check_pdf(pdf_head, returncode, stderr):
+    """
+    Проверяет результат запуска wkhtmltopdf по первым байтам PDF, при ошибке бросает RuntimeError.
+    Ненулевой код возврата при готовом PDF (например, не загрузилась картинка) - только предупреждение.
+    """
+    stderr = (stderr or b'').decode('utf-8', errors='replace').strip()
+    if not pdf_head.startswith(b'%PDF'):
+        raise RuntimeError(f'wkhtmltopdf завершился с кодом {returncode}: {stderr[-500:]}')
+    if returncode:
+        printer(f'[converter] wkhtmltopdf завершился с кодом {returncode}, PDF создан: {stderr[-500:]}',
+                kind='warning')
+
+
+def archive_report(cian_number, html, pdf, file_name):
+    """
+    Сохраняет отчёт, собранный в памяти, в downloads/<cian_number>/: index.html и PDF с именем file_name.
+    Возвращает путь к PDF или None при ошибке записи.
+    """
+    output_dir = os.path.join(downloads_dir_absolute, str(cian_number))
+    pdf_path = os.path.join(output_dir, file_name)
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        with open(file=os.path.join(output_dir, 'index.html'), mode='w', encoding='utf8') as f:
+            f.write(html)
+        with open(file=pdf_path, mode='wb') as f:
+            f.write(pdf)
+    except OSError as _ex:
+        printer(f'[converter] Не удалось сохранить отчёт в архив {output_dir}: {_ex}', kind='error')
+        return None
+    printer(f'[converter] Отчёт сохранён в архив: {pdf_path}', kind='info')
+    return pdf_path
+
+
+# Сколько wkhtmltopdf может работать одновременно в синхронном режиме (в боте очередь - в pdf_service)
+_slots = threading.BoundedSemaphore(PDF_WORKERS)
+
+
+def converter(page_index, header_index, footer_index):
+    """
+    Синхронно собирает PDF из HTML-отчёта. Одновременно работает не больше PDF_WORKERS процессов wkhtmltopdf,
+    процесс, не уложившийся в PDF_TIMEOUT секунд, завершается. Возвращает путь к PDF или None.
+    """
+    try:
+        RESULT_PDF = report_pdf_path(page_index)
+        args = pdf_command(page_index, header_index, footer_index, RESULT_PDF)
+        with _slots:
+            started = time.perf_counter()
+            # при истечении timeout subprocess.run() убивает процесс и бросает TimeoutExpired
+            completed = subprocess.run(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, timeout=PDF_TIMEOUT)
+        check_pdf(read_head(RESULT_PDF), completed.returncode, completed.stderr)
 
         # os.startfile(HTML_FILE) # Запускает шаблон HTML header-файла
         # os.remove(page_index)  # Удаляет шаблон HTML-файла
         # os.remove(header_index)  # Удаляет шаблон HTML header-файла
         # os.remove(footer_index)  # Удаляет шаблон HTML файла
         # os.startfile(RESULT_PDF)  # Запускать итоговый PDF
-        printer(f'[converter] Завершено создание PDF файла: {RESULT_PDF}', kind='info')
+        printer(f'[converter] Завершено создание PDF файла: {RESULT_PDF} '
+                f'за {time.perf_counter() - started:.2f} сек.', kind='info')
         return RESULT_PDF
 
+    except subprocess.TimeoutExpired:
+        printer(f'[converter] wkhtmltopdf не уложился в {PDF_TIMEOUT} сек. и остановлен: {page_index}', kind='error')
+        return None
     except Exception as _ex:
         printer(f'[converter] {_ex}', kind='error')
         return None
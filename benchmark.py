@@ -0,0 +1,242 @@
+"""
+Бенчмарки этапов обработки объявления на сохранённых страницах Циан.
+
+По умолчанию берутся все страницы из кэша downloads/<cian_number>/page.html
+(см. page_cache), либо можно передать пути к HTML-файлам явно:
+
+    python benchmark.py dom-index
+    python benchmark.py dom-index downloads/312256069/page.html --repeat 10
+    python benchmark.py backends
+    python benchmark.py partial
+    python benchmark.py state
+    python benchmark.py template
+    python benchmark.py report-values
+"""
+import argparse
+import glob
+import os
+import time
+import tracemalloc
+from bs4 import BeautifulSoup, FeatureNotFound
+from settings import downloads_dir_absolute
+from parser_cian.func import extract_listing, regions_for
+from parser_cian.dom_index import DomIndex
+from parser_cian.backend import FALLBACK_PARSER, make_soup
+from create_cian import REPORT_TEMPLATE_PATH, REPORT_PLACEHOLDERS, build_report_values
+from report_template import load_template
+
+# Построители BeautifulSoup, которые сравнивает bench_backends (неустановленные пропускаются)
+PARSERS = ('html.parser', 'lxml', 'html5lib')
+
+
+def load_corpus(paths):
+    """Читает HTML-страницы корпуса. Без явных путей берёт downloads/*/page.html."""
+    if not paths:
+        paths = sorted(glob.glob(os.path.join(downloads_dir_absolute, '*', 'page.html')))
+    corpus = []
+    for path in paths:
+        with open(path, mode='r', encoding='utf8') as f:
+            corpus.append((path, f.read()))
+    return corpus
+
+
+def best_time(func, repeat):
+    """Лучшее из repeat измерений времени вызова func(), в секундах."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_dom_index(corpus, repeat):
+    """
+    Сравнивает фазу извлечения данных: get_* напрямую по soup и get_* через DomIndex
+    (время DomIndex включает построение индекса). Проверяет, что результаты совпадают.
+    """
+    print(f"{'страница':<40} {'soup, мс':>10} {'DomIndex, мс':>13} {'ускорение':>10} {'совпадает':>10}")
+    total_plain = total_indexed = 0.0
+    for path, html in corpus:
+        soup = BeautifulSoup(html, 'html.parser')
+        plain = best_time(lambda: extract_listing(soup), repeat)
+        indexed = best_time(lambda: extract_listing(DomIndex(soup)), repeat)
+        same = extract_listing(soup) == extract_listing(DomIndex(soup))
+        total_plain += plain
+        total_indexed += indexed
+        name = os.path.relpath(path)[-40:]
+        print(f"{name:<40} {plain * 1000:>10.1f} {indexed * 1000:>13.1f} {plain / indexed:>9.1f}x {str(same):>10}")
+    if corpus:
+        print(f"{'ИТОГО':<40} {total_plain * 1000:>10.1f} {total_indexed * 1000:>13.1f} "
+              f"{total_plain / total_indexed:>9.1f}x")
+
+
+def bench_backends(corpus, repeat):
+    """
+    Сравнивает построители дерева: время разбора, время извлечения (get_* через DomIndex),
+    пиковую память на разбор+извлечение (tracemalloc) и совпадение результата с 'html.parser'.
+    """
+    available = []
+    for parser in PARSERS:
+        try:
+            BeautifulSoup('<html></html>', parser)
+            available.append(parser)
+        except FeatureNotFound:
+            print(f"Построитель '{parser}' не установлен, пропускаем.")
+
+    print(f"{'построитель':<12} {'разбор, мс':>11} {'извлечение, мс':>15} {'пик памяти, МБ':>15} {'совпадает':>10}")
+    reference = {path: extract_listing(DomIndex(BeautifulSoup(html, FALLBACK_PARSER))) for path, html in corpus}
+    for parser in available:
+        parse_total = extract_total = peak_max = 0.0
+        mismatched = []
+        for path, html in corpus:
+            parse_total += best_time(lambda: BeautifulSoup(html, parser), repeat)
+            soup = BeautifulSoup(html, parser)
+            extract_total += best_time(lambda: extract_listing(DomIndex(soup)), repeat)
+            del soup
+
+            tracemalloc.start()
+            result = extract_listing(DomIndex(BeautifulSoup(html, parser)))
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            peak_max = max(peak_max, peak / 1024 / 1024)
+
+            if result != reference[path]:
+                mismatched.append((path, result))
+        print(f"{parser:<12} {parse_total * 1000:>11.1f} {extract_total * 1000:>15.1f} {peak_max:>15.1f} "
+              f"{'да' if not mismatched else f'нет ({len(mismatched)})':>10}")
+        for path, result in mismatched:
+            differs = [key for key in reference[path] if result.get(key) != reference[path][key]]
+            print(f"    {os.path.relpath(path)}: отличаются поля {differs}")
+
+
+def bench_partial(corpus, repeat):
+    """
+    Сравнивает разбор всей страницы и частичный разбор только блоков из EXTRACTOR_REGIONS
+    (построитель - HTML_PARSER): время разбора+извлечения, число узлов дерева, пиковую память
+    и совпадение результатов.
+    """
+    regions = regions_for()
+    print(f"{'страница':<32} {'целиком, мс':>12} {'частично, мс':>13} {'узлов':>15} {'память, МБ':>13} {'совпадает':>10}")
+    for path, html in corpus:
+        full = best_time(lambda: extract_listing(DomIndex(make_soup(html))), repeat)
+        partial = best_time(lambda: extract_listing(DomIndex(make_soup(html, regions=regions))), repeat)
+
+        peaks, nodes, results = [], [], []
+        for kwargs in ({}, {'regions': regions}):
+            tracemalloc.start()
+            soup = make_soup(html, **kwargs)
+            results.append(extract_listing(DomIndex(soup)))
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024 / 1024)
+            tracemalloc.stop()
+            nodes.append(sum(1 for _ in soup.descendants))
+            del soup
+
+        name = os.path.relpath(path)[-32:]
+        print(f"{name:<32} {full * 1000:>12.1f} {partial * 1000:>13.1f} {f'{nodes[0]} / {nodes[1]}':>15} "
+              f"{f'{peaks[0]:.1f} / {peaks[1]:.1f}':>13} {'да' if results[0] == results[1] else 'нет':>10}")
+        if results[0] != results[1]:
+            differs = [key for key in results[0] if results[0][key] != results[1].get(key)]
+            print(f"    отличаются поля {differs}")
+
+
+def bench_state(corpus, repeat):
+    """
+    Сравнивает разбор только по разметке (make_soup всей страницы и get_* всех полей) и parse_page():
+    JSON-состояние плюс разбор DOM для полей, которых в состоянии нет (при PARTIAL_PARSE - только их блоков).
+    DOM разбирается в обоих случаях; столбец «из DOM» показывает, сколько полей всё равно берётся из разметки.
+    """
+    # parser импортирует send_file, которому нужны TOKEN и CHAT_ID из .env
+    from parser import parse_page, dom_fields
+    from parser_cian.state import find_offer_state, extract_from_state
+
+    print(f"{'страница':<40} {'только DOM, мс':>15} {'состояние+DOM, мс':>18} {'ускорение':>10} {'из DOM':>7}")
+    total_dom = total_state = 0.0
+    for path, html in corpus:
+        dom = best_time(lambda: extract_listing(DomIndex(make_soup(html))), repeat)
+        with_state = best_time(lambda: parse_page(html), repeat)
+        state = find_offer_state(html)
+        fields = dom_fields(extract_from_state(state) if state else {})
+        total_dom += dom
+        total_state += with_state
+        name = os.path.relpath(path)[-40:]
+        print(f"{name:<40} {dom * 1000:>15.1f} {with_state * 1000:>18.1f} {dom / with_state:>9.1f}x "
+              f"{len(fields):>7}")
+    if corpus:
+        print(f"{'ИТОГО':<40} {total_dom * 1000:>15.1f} {total_state * 1000:>18.1f} "
+              f"{total_dom / total_state:>9.1f}x")
+
+
+def bench_template(corpus, repeat):
+    """
+    Сравнивает сборку отчёта из cian7.html: прежний способ (чтение файла и str.replace по каждому
+    плейсхолдеру) и разобранный шаблон CompiledTemplate (один проход). Страницы корпуса не нужны.
+    """
+    # Значения примерно того же размера, что и в настоящем отчёте: строки таблиц, описание, фотографии
+    values = {name: f'<tr class="detail-item"><td>{name.lower()}</td><td>значение</td></tr>' * 2
+              for name in REPORT_PLACEHOLDERS}
+    values['ОПИСАНИЕ'] = 'Описание объявления. ' * 150
+
+    def render_replace():
+        with open(file=REPORT_TEMPLATE_PATH, mode='r', encoding='utf8') as f:
+            template = f.read()
+        for placeholder, value in values.items():
+            template = template.replace(placeholder, str(value))
+        return template
+
+    compiled = load_template(REPORT_TEMPLATE_PATH, REPORT_PLACEHOLDERS)
+    number = 200
+    replace_time = best_time(lambda: [render_replace() for _ in range(number)], repeat) / number
+    compiled_time = best_time(lambda: [compiled.render(values) for _ in range(number)], repeat) / number
+    same = render_replace() == compiled.render(values)
+    print(f"{'способ':<20} {'мкс на отчёт':>13}")
+    print(f"{'str.replace':<20} {replace_time * 1e6:>13.1f}")
+    print(f"{'CompiledTemplate':<20} {compiled_time * 1e6:>13.1f}")
+    print(f"ускорение {replace_time / compiled_time:.1f}x, результат совпадает: {'да' if same else 'нет'}")
+
+
+def bench_report_values(corpus, repeat):
+    """
+    Время подготовки значений отчёта (build_report_values: строки таблиц по DETAIL_ROWS, метро, описание)
+    и сборки HTML по шаблону для результатов разбора страниц корпуса. Каждый результат собирается
+    number раз подряд - так отчётов в замере тысячи даже на небольшом корпусе.
+    """
+    results = [(path, extract_listing(DomIndex(make_soup(html)))) for path, html in corpus]
+    compiled = load_template(REPORT_TEMPLATE_PATH, REPORT_PLACEHOLDERS)
+    number = 2000
+    print(f"{'страница':<40} {'значения, мкс':>14} {'с шаблоном, мкс':>16}")
+    for path, result in results:
+        values_time = best_time(lambda: [build_report_values(result) for _ in range(number)], repeat) / number
+        render_time = best_time(lambda: [compiled.render(build_report_values(result)) for _ in range(number)],
+                                repeat) / number
+        name = os.path.relpath(path)[-40:]
+        print(f"{name:<40} {values_time * 1e6:>14.1f} {render_time * 1e6:>16.1f}")
+
+
+# Бенчмарки, которым не нужны сохранённые страницы
+WITHOUT_CORPUS = {'template'}
+
+BENCHMARKS = {
+    'dom-index': bench_dom_index,
+    'backends': bench_backends,
+    'partial': bench_partial,
+    'state': bench_state,
+    'template': bench_template,
+    'report-values': bench_report_values,
+}
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Бенчмарки обработки объявлений Циан')
+    arg_parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    arg_parser.add_argument('pages', nargs='*', help='HTML-файлы страниц (по умолчанию downloads/*/page.html)')
+    arg_parser.add_argument('--repeat', type=int, default=5, help='сколько раз повторять каждое измерение')
+    args = arg_parser.parse_args()
+
+    pages = load_corpus(args.pages)
+    if not pages and args.benchmark not in WITHOUT_CORPUS:
+        print('Нет страниц для замера: сохраните объявления через бота или передайте пути к HTML-файлам.')
+    else:
+        BENCHMARKS[args.benchmark](pages, args.repeat)
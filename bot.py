@@ -6,14 +6,21 @@ import sys
 from datetime import datetime
 from icecream import ic
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import CommandStart
-from aiogram.types import FSInputFile, InputMediaPhoto
+from aiogram.filters import CommandStart, Command
+from aiogram.types import BufferedInputFile, InputMediaPhoto, InputMediaDocument
+from aiogram.exceptions import TelegramBadRequest
 from dotenv import load_dotenv
-from create_cian import format_price
+from create_cian import format_price, preload_templates
 
 # Предполагается, что эти импорты есть в вашем проекте
-from parser import parse_cian
-from settings import cookies, headers
+from parser import parse_cian_async, compare_cian_async
+from singleflight import SingleFlight
+from job_scheduler import JobScheduler, SchedulerFull
+from settings import cookies, headers, JOBS_PER_BATCH
+from http_client import close_async_session
+from pdf_service import pdf_service
+import report_cache
+import telegram_files
 
 # Настраиваем логирование
 logging.basicConfig(
@@ -46,8 +53,8 @@ else:
 bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 
-# Регулярное выражение для проверки URL Циан (квартиры)
-URL_PATTERN = re.compile(r"^https://www\.cian\.ru/sale/flat/\d+/?$", re.IGNORECASE)
+# Ссылка на объявление Циан (квартира) в любом месте сообщения; группа - номер объявления
+URL_PATTERN = re.compile(r"https?://(?:www\.)?cian\.ru/sale/flat/(\d+)/?", re.IGNORECASE)
 
 # Приветственное сообщение
 WELCOME_MESSAGE = (
@@ -55,11 +62,21 @@ WELCOME_MESSAGE = (
     "Отправь мне ссылку на квартиру в формате:\n"
     "🔹 `https://www.cian.ru/sale/flat/123456789/`\n\n"
     "Я обработаю её и пришлю данные в виде PDF-отчета, "
-    "текстового сообщения и фотографий (если доступны)."
+    "текстового сообщения и фотографий (если доступны).\n\n"
+    "Можно переслать сразу список ссылок: отчёты придут пачкой PDF-документов.\n"
+    "Команда `/compare <ссылки>` соберёт один PDF со сравнением объявлений."
 )
 
+# Одновременные запросы одного и того же объявления выполняются одной задачей
+listing_jobs = SingleFlight(name='listing_jobs')
+# Очередь обработки объявлений: общий лимит, лимит на пользователя, пользователи по кругу, админ вне очереди
+listing_scheduler = JobScheduler(name='listing_scheduler')
+
 MAX_CAPTION_LENGTH = 1024
 MAX_MESSAGE_LENGTH = 4096
+MAX_MEDIA_GROUP = 10  # документов в одной медиагруппе Telegram
+MAX_LINKS_PER_MESSAGE = 20  # сколько ссылок из одного сообщения обрабатывается, остальные отбрасываются
+MAX_COMPARE_LISTINGS = 6  # сколько объявлений помещается в таблицу сравнения /compare
 
 
 def escape_md(text: str) -> str:
@@ -223,8 +240,11 @@ def format_full_message_text(data: dict, url: str) -> str:
         for station_info in data['metro']:
             station = escape_md(str(station_info.get('station', 'N/A')))
             method = escape_md(str(station_info.get('method', 'N/A')))
-            time = escape_md(str(station_info.get('time', 'N/A')))
-            text_parts.append(f"  • {station} ({method} {time})")
+            time = station_info.get('time')
+            if time:
+                text_parts.append(f"  • {station} ({method} {escape_md(str(time))})")
+            else:
+                text_parts.append(f"  • {station} ({method})")
         text_parts.append("")
 
     if data.get('description'):
@@ -280,35 +300,222 @@ def format_full_message_text(data: dict, url: str) -> str:
     return full_text
 
 
+def report_document(report):
+    """
+    Документ отчёта для отправки: file_id, если отчёт уже загружался в Telegram, иначе байты PDF из памяти.
+    У отчёта, взятого по file_id без сборки (pdf=None), байтов нет: если его file_id забыт
+    (Telegram его не принял), бросается ValueError - обработчик сообщает об ошибке, а следующий
+    запрос того же объявления соберёт PDF заново.
+    """
+    file_id = telegram_files.get(report.key)
+    if file_id:
+        return file_id
+    if report.pdf is None:
+        raise ValueError(f"PDF отчета {report.file_name} не собран, а его file_id не принят Telegram")
+    return BufferedInputFile(report.pdf, filename=report.file_name)
+
+
+async def send_report(send, report, **kwargs):
+    """
+    Отправляет PDF отчёта методом send (message.answer_document / bot.send_document).
+    Если отчёт уже загружался в Telegram, отправляется его file_id без загрузки байтов;
+    иначе PDF загружается из памяти, и полученный file_id запоминается в telegram_files.
+    """
+    file_id = telegram_files.get(report.key)
+    if file_id:
+        try:
+            return await send(document=file_id, **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning(f"file_id отчета {report.file_name} не принят Telegram, загружаем заново: {e}")
+            telegram_files.forget(report.key)
+    sent = await send(document=report_document(report), **kwargs)
+    if sent.document:
+        telegram_files.put(report.key, sent.document.file_id)
+    return sent
+
+
+def extract_cian_numbers(text):
+    """Номера объявлений из всех ссылок Циан в тексте, без повторов, в порядке появления."""
+    return list(dict.fromkeys(URL_PATTERN.findall(text or '')))
+
+
+def listing_url(cian_number):
+    return f"https://www.cian.ru/sale/flat/{cian_number}/"
+
+
+def run_listing(cian_number, user_id, priority=False, on_queued=None, per_user=None):
+    """
+    Обрабатывает объявление в общей очереди listing_scheduler и возвращает (RenderedReport или None, результат).
+    Если это объявление уже обрабатывается по запросу из другого чата, ждём тот же результат.
+    per_user - лимит одновременных заданий пользователя вместо JOBS_PER_USER (см. JobScheduler.run).
+    """
+    return listing_jobs.run(
+        cian_number, lambda: listing_scheduler.run(
+            user_id, lambda: parse_cian_async(listing_url(cian_number), cookies, headers),
+            priority=priority, on_queued=on_queued, per_user=per_user))
+
+
+def report_media(report, caption):
+    """Документ отчёта для медиагруппы (см. report_document())."""
+    return InputMediaDocument(media=report_document(report), caption=caption, parse_mode="Markdown")
+
+
+def media_chunks(items):
+    """
+    Делит items на медиагруппы не больше MAX_MEDIA_GROUP элементов почти равного размера.
+    Telegram принимает медиагруппу только из 2-10 документов, поэтому группы из одного документа
+    не бывает: 11 отчётов уходят группами 5 и 6, а не 10 и 1.
+    """
+    count = -(-len(items) // MAX_MEDIA_GROUP)  # округление вверх
+    chunks = []
+    start = 0
+    for number in range(count):
+        size = (len(items) - start) // (count - number)
+        chunks.append(items[start:start + size])
+        start += size
+    return chunks
+
+
+async def send_report_group(send, send_group, items, **kwargs):
+    """
+    Отправляет отчёты items [(RenderedReport, подпись), ...] медиагруппами документов (см. media_chunks)
+    методом send_group (message.answer_media_group / bot.send_media_group) и запоминает file_id.
+    Единственный отчёт медиагруппой не отправить, он уходит обычным документом методом send
+    (message.answer_document / bot.send_document) через send_report().
+    Если Telegram не принял сохранённый file_id, группа отправляется заново загрузкой байтов.
+    """
+    if len(items) == 1:
+        report, caption = items[0]
+        await send_report(send, report, caption=caption, parse_mode="Markdown", **kwargs)
+        return
+    for chunk in media_chunks(items):
+        try:
+            sent = await send_group(media=[report_media(report, caption) for report, caption in chunk], **kwargs)
+        except TelegramBadRequest as e:
+            logger.warning(f"Медиагруппа с file_id не принята Telegram, загружаем отчеты заново: {e}")
+            for report, _ in chunk:
+                telegram_files.forget(report.key)
+            sent = await send_group(media=[report_media(report, caption) for report, caption in chunk], **kwargs)
+        for (report, _), sent_message in zip(chunk, sent):
+            if sent_message.document:
+                telegram_files.put(report.key, sent_message.document.file_id)
+
+
 @dp.message(CommandStart())
 async def start_command(message: types.Message):
     await message.answer(WELCOME_MESSAGE, parse_mode="Markdown")
 
 
+@dp.message(Command("compare"))
+async def compare_command(message: types.Message, current_bot: Bot = bot):
+    """
+    /compare <ссылки>: один PDF с таблицей сравнения (цена, цена за м², площадь, этаж, метро, год)
+    и отчётами по каждому объявлению. Всё сравнение - одно задание в общей очереди listing_scheduler.
+    """
+    user_id = message.from_user.id
+    is_admin_request = ADMIN_CHAT_ID is not None and user_id == ADMIN_CHAT_ID
+    cian_numbers = extract_cian_numbers(message.text)[:MAX_COMPARE_LISTINGS]
+    if len(cian_numbers) < 2:
+        await message.answer(
+            "Для сравнения пришлите после команды от 2 до "
+            f"{MAX_COMPARE_LISTINGS} ссылок на квартиры с `www.cian.ru`, например:\n"
+            "`/compare https://www.cian.ru/sale/flat/123456789/ https://www.cian.ru/sale/flat/987654321/`",
+            parse_mode="Markdown")
+        return
+
+    processing_msg = await message.answer(f"⏳ Готовлю сравнение {len(cian_numbers)} объявлений...")
+
+    async def notify_queued(position):
+        await processing_msg.edit_text(f"🕒 Все обработчики заняты, сравнение в очереди: позиция {position}.")
+
+    try:
+        urls = [listing_url(cian_number) for cian_number in cian_numbers]
+        report, results = await listing_scheduler.run(
+            user_id, lambda: compare_cian_async(urls, cookies, headers),
+            priority=is_admin_request, on_queued=notify_queued)
+        if not report and len(results) >= 2:
+            await message.answer("❌ Данные объявлений получены, но PDF сравнения собрать не удалось. "
+                                 "Пожалуйста, попробуйте позже.")
+            return
+        if not report:
+            await message.answer(f"⚠️ Не удалось собрать сравнение: данные получены "
+                                 f"по {len(results)} из {len(cian_numbers)} объявлений.")
+            return
+        caption = f"Сравнение {len(results)} объявлений"
+        await send_report(message.answer_document, report, caption=caption)
+        if ADMIN_CHAT_ID and not is_admin_request:
+            await send_report(current_bot.send_document, report, chat_id=ADMIN_CHAT_ID,
+                              caption=f"{caption} (запрос от {user_id})")
+    except SchedulerFull:
+        await message.answer("🚦 Сейчас слишком много запросов, очередь заполнена. "
+                             "Пожалуйста, повторите команду через несколько минут.")
+    except Exception as e:
+        logger.exception(f"Ошибка при сравнении {cian_numbers} для пользователя {user_id}: {e}")
+        await message.answer("❌ Произошла внутренняя ошибка при подготовке сравнения. Пожалуйста, попробуйте позже.")
+    finally:
+        try:
+            await current_bot.delete_message(chat_id=message.chat.id, message_id=processing_msg.message_id)
+        except Exception:
+            pass
+
+
+@dp.message(Command("stats"))
+async def stats_command(message: types.Message):
+    """/stats (только администратор): очередь заданий, сборка PDF и кэш отчётов с запуска бота."""
+    if ADMIN_CHAT_ID is None or message.from_user.id != ADMIN_CHAT_ID:
+        return
+    jobs = listing_scheduler.stats()
+    pdf = pdf_service.stats()
+    cache = report_cache.stats()
+    text = "\n".join([
+        f"Очередь: выполняется {jobs['running']}, ждут {jobs['queued']} "
+        f"(админ {jobs['priority']}, пользователей {jobs['users_waiting']})",
+        f"PDF: собрано {pdf['done']}, ошибок {pdf['failed']}, таймаутов {pdf['timeout']}, в очереди {pdf['queued']}",
+        f"PDF ожидание: ср. {pdf['wait']['avg']:.2f} сек., макс. {pdf['wait']['max']:.2f} сек.",
+        f"PDF сборка: ср. {pdf['render']['avg']:.2f} сек., макс. {pdf['render']['max']:.2f} сек.",
+        f"Кэш отчётов: попаданий {cache['hit']}, промахов {cache['miss']}, вытеснено {cache['evicted']}, "
+        f"отчётов {cache['entries']} ({cache['bytes'] // 1024} КБ)",
+    ])
+    logger.info(f"Статистика: очередь {jobs}, PDF {pdf}, кэш {cache}")
+    await message.answer(text)
+
+
 @dp.message(F.text)
 async def process_cian_url(message: types.Message, current_bot: Bot = bot):
-    url = message.text.strip()
     user_id = message.from_user.id
     is_admin_request = ADMIN_CHAT_ID is not None and user_id == ADMIN_CHAT_ID
+    cian_numbers = extract_cian_numbers(message.text)
 
-    if not URL_PATTERN.match(url):
+    if not cian_numbers:
         await message.answer(
             "🚫 *Ошибка: Неверный формат ссылки.*\n\n"
             "Пожалуйста, отправьте ссылку на квартиру с `www.cian.ru`.\n"
-            "Пример: `https://www.cian.ru/sale/flat/123456789/`",
+            "Пример: `https://www.cian.ru/sale/flat/123456789/`\n"
+            "Можно прислать несколько ссылок одним сообщением.",
             parse_mode="Markdown"
         )
         return
+    if len(cian_numbers) > 1:
+        await process_cian_batch(message, cian_numbers, current_bot)
+        return
 
+    cian_number = cian_numbers[0]
+    url = listing_url(cian_number)
     processing_msg = await message.answer(
         f"⏳ Обрабатываю страницу: {escape_md(url)}\nПожалуйста, подождите...")
 
     try:
-        if sys.version_info >= (3, 9):
-            report_path, result_data = await asyncio.to_thread(parse_cian, url, cookies, headers)
-        else:
-            loop = asyncio.get_event_loop()
-            report_path, result_data = await loop.run_in_executor(None, parse_cian, url, cookies, headers)
+        # Сетевые операции идут корутинами на этом же event loop,
+        # в пул потоков уходят только разбор HTML и рендеринг PDF.
+        # Если это объявление уже обрабатывается по запросу из другого чата, ждём тот же результат.
+        # Свободного обработчика нет - сообщаем пользователю его место в очереди
+        async def notify_queued(position):
+            await processing_msg.edit_text(
+                f"🕒 Все обработчики заняты, ваша ссылка в очереди: позиция {position}.\n"
+                f"Отчёт придёт автоматически: {escape_md(url)}")
+
+        report, result_data = await run_listing(cian_number, user_id, priority=is_admin_request,
+                                                on_queued=notify_queued)
 
         # Добавим логгирование полученных данных для отладки
         # logger.info(f"Получены данные от парсера для URL {url}: {result_data}")
@@ -324,27 +531,27 @@ async def process_cian_url(message: types.Message, current_bot: Bot = bot):
 
         short_caption = format_short_caption(result_data, url)
         pdf_sent_to_user = False
-        if report_path and os.path.exists(report_path):
+        if report:
             try:
-                pdf_document_for_user = FSInputFile(report_path)
-                await message.answer_document(document=pdf_document_for_user,
-                                              caption=short_caption,
-                                              parse_mode="Markdown")
+                # PDF загружается в Telegram один раз, копия администратору и повторные отправки идут по file_id
+                await send_report(message.answer_document, report,
+                                  caption=short_caption,
+                                  parse_mode="Markdown")
                 pdf_sent_to_user = True
                 if ADMIN_CHAT_ID and not is_admin_request:
-                    pdf_document_for_admin = FSInputFile(report_path)
                     admin_caption = f"Отчет по {escape_md(url)} (запрос от {user_id}):\n{short_caption}"
                     if len(admin_caption) > MAX_CAPTION_LENGTH:
                         admin_caption = admin_caption[:MAX_CAPTION_LENGTH - 3] + "..."
-                    await current_bot.send_document(chat_id=ADMIN_CHAT_ID, document=pdf_document_for_admin,
-                                                    caption=admin_caption,
-                                                    parse_mode="Markdown")
+                    await send_report(current_bot.send_document, report,
+                                      chat_id=ADMIN_CHAT_ID,
+                                      caption=admin_caption,
+                                      parse_mode="Markdown")
             except Exception as e_pdf:
-                logger.error(f"Ошибка при отправке PDF ({report_path}) пользователю {user_id}: {e_pdf}")
+                logger.error(f"Ошибка при отправке PDF ({report.file_name}) пользователю {user_id}: {e_pdf}")
                 fallback_text_user = f"Не удалось отправить PDF отчет. {short_caption}"  # short_caption уже готов
                 await message.answer(fallback_text_user, parse_mode="Markdown")
                 if ADMIN_CHAT_ID and not is_admin_request:
-                    admin_error_text = f"Ошибка отправки PDF ({escape_md(report_path)}) для {escape_md(url)} пользователю {user_id}: {escape_md(str(e_pdf))}\nКороткое описание: {short_caption}"
+                    admin_error_text = f"Ошибка отправки PDF ({escape_md(report.file_name)}) для {escape_md(url)} пользователю {user_id}: {escape_md(str(e_pdf))}\nКороткое описание: {short_caption}"
                     if len(admin_error_text) > MAX_MESSAGE_LENGTH:
                         admin_error_text = admin_error_text[
                                            :MAX_MESSAGE_LENGTH - 100] + "..."
@@ -352,7 +559,7 @@ async def process_cian_url(message: types.Message, current_bot: Bot = bot):
                                                    text=admin_error_text,
                                                    parse_mode="Markdown")
         else:
-            logger.warning(f"Файл отчета PDF не найден или не был создан: {report_path} для URL: {url}")
+            logger.warning(f"Отчет PDF не был создан для URL: {url}")
             # Если PDF нет, отправляем только short_caption как текстовое сообщение
             await message.answer(short_caption, parse_mode="Markdown")
             if ADMIN_CHAT_ID and not is_admin_request:
@@ -392,6 +599,10 @@ async def process_cian_url(message: types.Message, current_bot: Bot = bot):
         #                 await current_bot.send_message(chat_id=ADMIN_CHAT_ID,
         #                                                text=f"Ошибка отправки фото для {escape_md(url)} пользователю {user_id}: {escape_md(str(e_media))}")
 
+    except SchedulerFull:
+        logger.warning(f"Очередь заполнена, запрос {url} пользователя {user_id} отклонён: {listing_scheduler.stats()}")
+        await message.answer("🚦 Сейчас слишком много запросов, очередь заполнена. "
+                             "Пожалуйста, отправьте ссылку ещё раз через несколько минут.")
     except asyncio.CancelledError:
         logger.warning(f"Задача обработки URL {url} для пользователя {user_id} была отменена.")
     except Exception as e:
@@ -412,9 +623,88 @@ async def process_cian_url(message: types.Message, current_bot: Bot = bot):
             pass
 
 
+async def process_cian_batch(message: types.Message, cian_numbers, current_bot: Bot = bot):
+    """
+    Обрабатывает несколько ссылок из одного сообщения: объявления идут в общую очередь listing_scheduler,
+    и одновременно обрабатывается до JOBS_PER_BATCH из них (вместо JOBS_PER_USER, в пределах общего лимита
+    JOBS_MAX_CONCURRENT и по кругу с другими пользователями). Одно сообщение о ходе работы редактируется
+    по мере готовности, а готовые PDF отправляются медиагруппами документов.
+    """
+    user_id = message.from_user.id
+    is_admin_request = ADMIN_CHAT_ID is not None and user_id == ADMIN_CHAT_ID
+    skipped = cian_numbers[MAX_LINKS_PER_MESSAGE:]
+    cian_numbers = cian_numbers[:MAX_LINKS_PER_MESSAGE]
+    statuses = {cian_number: "⏳ в работе" for cian_number in cian_numbers}
+    progress_lock = asyncio.Lock()
+
+    def progress_text():
+        done = sum(1 for status in statuses.values() if not status.startswith(("⏳", "🕒")))
+        lines = [f"Обрабатываю объявления: готово {done} из {len(cian_numbers)}"]
+        lines += [f"{status} - {listing_url(cian_number)}" for cian_number, status in statuses.items()]
+        if skipped:
+            lines.append(f"Пропущено ссылок сверх {MAX_LINKS_PER_MESSAGE}: {len(skipped)}")
+        return "\n".join(lines)
+
+    progress_msg = await message.answer(progress_text(), disable_web_page_preview=True)
+
+    async def set_status(cian_number, status):
+        # Правки одного сообщения идут по очереди: параллельные edit_text перетирали бы друг друга
+        async with progress_lock:
+            statuses[cian_number] = status
+            try:
+                await progress_msg.edit_text(progress_text(), disable_web_page_preview=True)
+            except TelegramBadRequest:
+                pass  # текст не изменился
+
+    async def process_one(cian_number):
+        try:
+            report, result_data = await run_listing(
+                cian_number, user_id, priority=is_admin_request, per_user=JOBS_PER_BATCH,
+                on_queued=lambda position: set_status(cian_number, f"🕒 в очереди, позиция {position}"))
+        except SchedulerFull:
+            await set_status(cian_number, "🚦 очередь заполнена, пришлите позже")
+            return None
+        except Exception as e:
+            logger.exception(f"Ошибка при обработке {listing_url(cian_number)} для пользователя {user_id}: {e}")
+            await set_status(cian_number, "❌ внутренняя ошибка")
+            return None
+        if not result_data:
+            await set_status(cian_number, "⚠️ не удалось получить данные")
+            return None
+        if not report:
+            await set_status(cian_number, "⚠️ PDF не создан")
+            return None
+        await set_status(cian_number, "✅ готово")
+        return report, format_short_caption(result_data, listing_url(cian_number))
+
+    results = await asyncio.gather(*(process_one(cian_number) for cian_number in cian_numbers))
+    items = [item for item in results if item]
+    if not items:
+        return
+
+    try:
+        await send_report_group(message.answer_document, message.answer_media_group, items)
+        if ADMIN_CHAT_ID and not is_admin_request:
+            # Отчёты уже загружены пользователю, администратору они уходят по file_id
+            await current_bot.send_message(chat_id=ADMIN_CHAT_ID,
+                                           text=f"Пакет из {len(items)} отчетов (запрос от {user_id})")
+            await send_report_group(current_bot.send_document, current_bot.send_media_group, items,
+                                    chat_id=ADMIN_CHAT_ID)
+    except Exception as e_pdf:
+        logger.error(f"Ошибка при отправке пакета PDF пользователю {user_id}: {e_pdf}")
+        await message.answer("Не удалось отправить PDF отчеты. Попробуйте прислать ссылки ещё раз.")
+
+
 async def main():
     logger.info("Запуск бота...")
-    await dp.start_polling(bot)
+    preload_templates()
+    telegram_files.preload()
+    try:
+        await dp.start_polling(bot)
+    finally:
+        await pdf_service.close()
+        await close_async_session()
+        telegram_files.flush()
 
 
 if __name__ == "__main__":
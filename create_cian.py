@@ -2,13 +2,111 @@ import os
 import re  # Для очистки описания от лишних пробелов и замены переносов строк
 import traceback  # Для более детальной информации об ошибке
 import datetime
-from servise import printer
-from settings import templates_dir_absolute, downloads_dir_absolute
+import base64
+import hashlib
+import shutil
+import threading
+from servise import printer, write_atomic
+from settings import templates_dir_absolute, downloads_dir_absolute, REPORT_IMAGES, REPORT_IMAGE_WIDTH, BRANDING_DIR
+from parser_cian.thumbnails import report_thumbnail
+from report_template import load_template
 from dotenv import load_dotenv
 from icecream import ic
 
 load_dotenv()
 
+# Шаблоны отчёта и плейсхолдеры в них. Шаблон разбирается один раз (report_template.CompiledTemplate)
+# и перечитывается только при изменении файла.
+REPORT_TEMPLATE_PATH = os.path.join(templates_dir_absolute, 'cian7.html')
+HEADER_TEMPLATE_PATH = os.path.join(templates_dir_absolute, 'header.html')
+FOOTER_TEMPLATE_PATH = os.path.join(templates_dir_absolute, 'footer.html')
+
+HEADER_PLACEHOLDERS = (
+    'ИМЯ_РИЕЛТОРА',
+    'ТЕЛЕФОН_РИЕЛТОРА',
+    'ТЕЛЕФОН_РИЕЛТОРА_PLACEHOLDER',  # номер для ссылки tel:, без пробелов и скобок
+    'EMAIL_PLACEHOLDER',
+    'TELEGRAM_BOT_USERNAME',
+    'TELEGRAM_BOT_LINK',
+    'WHATSAPP_ICON',
+    'INSTAGRAM_ICON',
+    'TELEGRAM_ICON',
+    'VK_ICON',
+    'VIBER_ICON',
+)
+# Иконки соцсетей в заголовке: плейсхолдер -> файл в html_template/.
+# В заголовок они встраиваются как data: URI, чтобы wkhtmltopdf не обращался ни к диску, ни к сети.
+HEADER_ICONS = {
+    'WHATSAPP_ICON': 'whatsapp-48.png',
+    'INSTAGRAM_ICON': 'instagram-48.png',
+    'TELEGRAM_ICON': 'теlegram-48.png',
+    'VK_ICON': 'vk-48.png',
+    'VIBER_ICON': 'viber-48.png',
+}
+# Иконка станции метро (bi-geo-alt-fill из Bootstrap Icons), встроенная в отчёт вместо шрифта с CDN
+METRO_ICON = ('<svg xmlns="http://www.w3.org/2000/svg" fill="currentColor" class="bi bi-geo-alt-fill" '
+              'viewBox="0 0 16 16"><path d="M8 16s6-5.686 6-10A6 6 0 0 0 2 6c0 4.314 6 10 6 10m0-7a3 3 0 1 1 '
+              '0-6 3 3 0 0 1 0 6"/></svg>')
+REPORT_PLACEHOLDERS = (
+    'DATE_TAME_ROW',
+    'ОБНОВЛЕНО_ROW',
+    'ПРОСМОТРЫ_ROW',
+    'ИМЯ_РИЕЛТОРА',
+    'ТЕЛЕФОН_РИЕЛТОРА',
+    'НАЗВАНИЕ',
+    'АДРЕС',
+    'ТИП_ЖИЛЬЯ',
+    'СТОИМОСТЬ',
+    'МЕТРО',
+    'ЦЕНА_ЗА_МЕТР',
+    'УСЛОВИЯ_СДЕЛКИ',
+    'ИПОТЕКА',
+    'ФОТОГРАФИИ',
+    'ГОД_ПОСТРОЙКИ',
+    'ОПИСАНИЕ',
+    'ОБЩАЯ_ПЛОЩАДЬ_ROW',
+    'ЖИЛАЯ_ПЛОЩАДЬ_ROW',
+    'ПЛОЩАДЬ_КУХНИ_ROW',
+    'ВЫСОТА_ПОТОЛКОВ_ROW',
+    'ЭТАЖ_ROW',
+    'БАЛКОН_ROW',
+    'РЕМОНТ_ROW',
+    'ОТДЕЛКА_ROW',
+    'САНУЗЕЛ_ROW',
+    'ВИД_ИЗ_ОКОН_ROW',
+    'СОБСТВЕННИКОВ_ROW',
+    'ОБРЕМЕНЕНИЯ_ROW',
+    'МЕБЕЛЬ_ROW',
+    'КАДАСТРОВЫЙ_НОМЕР_ROW',
+    'ТИП_ДОМА_ROW',
+    'ТИП_ПЕРЕКРЫТИЙ_ROW',
+    'СТРОИТЕЛЬНАЯ_СЕРИЯ_ROW',
+    'КОЛИЧЕСТВО_ЛИФТОВ_ROW',
+    'ПОДЪЕЗДЫ_ROW',
+    'МУСОРОПРОВОД_ROW',
+    'ПАРКОВКА_ROW',
+    'ОТОПЛЕНИЕ_ROW',
+    'АВАРИЙНОСТЬ_ROW',
+    'ГАЗОСНАБЖЕНИЕ_ROW',
+    'ЗАСТРОЙЩИК_ROW',
+    'КЛАСС_ДОМА_ROW',
+    'ЗДАЧА_КОМПЛЕКСА_ROW',
+    'ТИП_КОМПЛЕКСА_ROW',
+    'О_ЗАСТРОЙЩИКЕ_INFO',
+)
+
+
+def preload_templates():
+    """
+    Разбирает шаблоны отчёта и отрисовывает заголовок с подвалом заранее (при старте бота),
+    чтобы первый отчёт не тратил на это время.
+    """
+    try:
+        load_template(REPORT_TEMPLATE_PATH, REPORT_PLACEHOLDERS)
+        create_header_and_footer()
+    except OSError as _ex:
+        printer(f'[create_cian] Не удалось загрузить шаблоны отчёта: {_ex}', kind='error')
+
 
 def format_price(price_string):
     """
@@ -65,564 +163,497 @@ def format_price(price_string):
         return 'Цена не указана'
 
 
-def create_header_and_footer(cian_number):
-    """
-    Создаёт заголовок и подвал для HTML-отчета.
-    """
-    header_template_path = os.path.join(templates_dir_absolute, 'header.html')
-    footer_template_path = os.path.join(templates_dir_absolute, 'footer.html')
-
-    header_index = os.path.join(downloads_dir_absolute, os.path.join(cian_number, 'header_index.html'))
-    footer_index = os.path.join(downloads_dir_absolute, os.path.join(cian_number, 'footer_index.html'))
+def branding_profile():
+    """Значения плейсхолдеров заголовка и подвала: контакты риелтора и бота из переменных окружения."""
+    return {
+        'ИМЯ_РИЕЛТОРА': os.getenv("NAME", ""),
+        'ТЕЛЕФОН_РИЕЛТОРА': os.getenv("PHONE", ""),
+        'ТЕЛЕФОН_РИЕЛТОРА_PLACEHOLDER': re.sub(r'[^\d+]', '', os.getenv("PHONE", "")),
+        'EMAIL_PLACEHOLDER': os.getenv("EMAIL", ""),
+        'TELEGRAM_BOT_USERNAME': os.getenv("TELEGRAM_BOT_USERNAME", ""),
+        'TELEGRAM_BOT_LINK': os.getenv("TELEGRAM_BOT_LINK", ""),
+    }
 
-    replace_list = [
-        ('ИМЯ_РИЕЛТОРА', os.getenv("NAME", "")),
-        ('ТЕЛЕФОН_РИЕЛТОРА', os.getenv("PHONE", "")),
-        ('EMAIL_PLACEHOLDER', os.getenv("EMAIL", "")),
-        ('TELEGRAM_BOT_USERNAME', os.getenv("TELEGRAM_BOT_USERNAME", "")),
-        ('TELEGRAM_BOT_LINK', os.getenv("TELEGRAM_BOT_LINK", ""))
-    ]
 
-    with open(file=header_template_path, mode='r', encoding='utf8') as f:
-        header_html = f.read()
+def _data_uri(path, mime='image/png'):
+    with open(path, mode='rb') as f:
+        return f'data:{mime};base64,{base64.b64encode(f.read()).decode("ascii")}'
 
-    for i in replace_list:
-        header_html = header_html.replace(i[0], i[1])
 
-    with open(file=header_index, mode='w', encoding='utf8') as f:
-        f.write(header_html)
+def _icon_path(file_name):
+    return os.path.join(templates_dir_absolute, file_name)
 
-    with open(file=footer_template_path, mode='r', encoding='utf8') as f:
-        footer_html = f.read()
 
-    for i in replace_list:
-        footer_html = footer_html.replace(i[0], i[1])
+def header_icons():
+    """Значения плейсхолдеров иконок заголовка: data: URI файлов из HEADER_ICONS."""
+    return {placeholder: _data_uri(_icon_path(file_name)) for placeholder, file_name in HEADER_ICONS.items()}
 
-    with open(file=footer_index, mode='w', encoding='utf8') as f:
-        f.write(footer_html)
 
-    return header_index, footer_index
+# Уже отрисованные заголовки и подвалы: ключ профиля -> (header_index, footer_index)
+_branding_rendered = {}
+_branding_lock = threading.Lock()
 
 
-def create_report_cian(res, cian_number):
+def _prune_branding(keep_hash):
     """
-    Создает HTML-отчет на основе шаблона cian.html и данных из словаря res.
-    Заменяет плейсхолдеры в шаблоне и сохраняет результат в новый файл.
+    Удаляет из BRANDING_DIR каталоги прежних профилей брендинга: после смены контактов или шаблонов
+    они больше не нужны, а иначе копились бы по одному на каждую смену.
+    """
+    for name in os.listdir(BRANDING_DIR):
+        path = os.path.join(BRANDING_DIR, name)
+        if name != keep_hash and re.fullmatch(r'[0-9a-f]{12}', name) and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+            printer(f'[create_cian] Удалён каталог прежнего профиля брендинга {name}', kind='info')
 
-    Args:
-        res (dict): Словарь с данными для заполнения шаблона.
-        cian_number (str): Номер объявления Cian, используется для создания пути.
+
+def create_header_and_footer():
     """
-    header_index, footer_index = create_header_and_footer(cian_number)
-    tempfile_path = os.path.join(templates_dir_absolute, 'cian7.html')
+    Возвращает пути к заголовку и подвалу HTML-отчета (header_index.html, footer_index.html).
 
-    # Убедимся, что директория для cian_number существует или создаем ее
-    output_dir = os.path.join(downloads_dir_absolute, str(cian_number))
-    os.makedirs(output_dir, exist_ok=True)
+    Заголовок и подвал одинаковы для всех объявлений и зависят только от профиля брендинга
+    (branding_profile) и шаблонов, поэтому отрисовываются один раз в общий каталог
+    BRANDING_DIR/<хэш профиля>/ и заново - только при смене контактов или правке шаблонов;
+    каталоги прежних профилей при этом удаляются.
+    """
+    values = branding_profile()
+    header_template = load_template(HEADER_TEMPLATE_PATH, HEADER_PLACEHOLDERS)
+    footer_template = load_template(FOOTER_TEMPLATE_PATH, HEADER_PLACEHOLDERS)
+    header_template.reload()
+    footer_template.reload()
+    icons_mtime = tuple(os.path.getmtime(_icon_path(file_name)) for file_name in HEADER_ICONS.values())
+    key = (tuple(values.items()), header_template.mtime, footer_template.mtime, icons_mtime)
+
+    paths = _branding_rendered.get(key)
+    if paths and all(os.path.exists(path) for path in paths):
+        return paths
+
+    with _branding_lock:
+        paths = _branding_rendered.get(key)
+        if paths and all(os.path.exists(path) for path in paths):
+            return paths
+
+        profile_hash = hashlib.sha1(repr(key).encode('utf8')).hexdigest()[:12]
+        profile_dir = os.path.join(BRANDING_DIR, profile_hash)
+        os.makedirs(profile_dir, exist_ok=True)
+        header_index = os.path.join(profile_dir, 'header_index.html')
+        footer_index = os.path.join(profile_dir, 'footer_index.html')
+        values = {**values, **header_icons()}
+        write_atomic(header_index, header_template.render(values))
+        write_atomic(footer_index, footer_template.render(values))
+
+        _branding_rendered.clear()
+        _branding_rendered[key] = header_index, footer_index
+        _prune_branding(profile_hash)
+        printer(f'[create_cian] Заголовок и подвал отчёта отрисованы для профиля {profile_hash}', kind='info')
+        return header_index, footer_index
+
+
+# --- Строки таблиц деталей отчёта ---
+
+# Значения, при которых строка таблицы не выводится
+EMPTY_VALUES_FOR_HIDE = ('?', None, '', 'Не указано', 'Не указана', 'Нет данных')
+
+ROW_HTML = """<tr class="detail-item">
+                                <td class="label-cell"><span class="label">{label}</span></td>
+                                <td class="value-cell"><span class="value">{value}</span></td>
+                            </tr>"""
 
-    output_filename = 'index.html'  # Имя выходного файла
-    output_path = os.path.join(output_dir, output_filename)
 
-    try:
-        with open(file=tempfile_path, mode='r', encoding='utf8') as f:
-            template = f.read()
-
-        # --- Подготовка данных ---
-
-        # Безопасное извлечение данных. Используем `res.get(key) or default`,
-        # чтобы обработать случаи, когда значение по ключу в res может быть None.
-        offer = res.get('offer') or {}
-        metro_list = res.get('metro') or []
-        params = res.get('params') or {}
-        author_branding = res.get('author_branding') or {}
-        offer_metadata = res.get('offer_metadata') or {}
-        developer = res.get('developer') or {}
-        if 'Отделка' in developer:
-            Dash_square = '''
-            <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" class="bi bi-dash-square" viewBox="0 0 16 16">
-              <path d="M14 1a1 1 0 0 1 1 1v12a1 1 0 0 1-1 1H2a1 1 0 0 1-1-1V2a1 1 0 0 1 1-1zM2 0a2 2 0 0 0-2 2v12a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V2a2 2 0 0 0-2-2z"/>
-              <path d="M4 8a.5.5 0 0 1 .5-.5h7a.5.5 0 0 1 0 1h-7A.5.5 0 0 1 4 8"/>
-            </svg>
-            '''
-            Empty_square = '''
-            <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" class="bi bi-square" viewBox="0 0 16 16">
-              <path d="M14 1a1 1 0 0 1 1 1v12a1 1 0 0 1-1 1H2a1 1 0 0 1-1-1V2a1 1 0 0 1 1-1zM2 0a2 2 0 0 0-2 2v12a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V2a2 2 0 0 0-2-2z"/>
-            </svg>
-            '''
-            Check_square = '''
-            <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" class="bi bi-check-square" viewBox="0 0 16 16">
-              <path d="M14 1a1 1 0 0 1 1 1v12a1 1 0 0 1-1 1H2a1 1 0 0 1-1-1V2a1 1 0 0 1 1-1zM2 0a2 2 0 0 0-2 2v12a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V2a2 2 0 0 0-2-2z"/>
-              <path d="M10.97 4.97a.75.75 0 0 1 1.071 1.05l-3.992 4.99a.75.75 0 0 1-1.08.02L4.324 8.384a.75.75 0 1 1 1.06-1.06l2.094 2.093 3.473-4.425z"/>
-            </svg>
-            '''
-            otdelka = developer['Отделка'].lower().split(',')
-            otdelka_new = []
-            for i in otdelka:
-                if i == params['Отделка'].lower():
-                    otdelka_new.append(f"{Check_square}{i}")
-                else:
-                    otdelka_new.append(f"{Empty_square}{i}")
-            params['Отделка'] = '<br>'.join(otdelka_new)
-            # params['Отделка'] = developer['Отделка'].lower().replace(', ', '<br>').replace(params['Отделка'].lower(),f"<b>{params['Отделка'].lower()}</b>").capitalize()
-        if 'Парковка' in params and 'Парковка' in developer:
-            if len(params['Парковка']) < len(developer['Парковка']):
-                params['Парковка'] = developer['Парковка']
-        if 'Тип дома' in params and 'Тип дома' in developer:
-            if len(params['Тип дома']) < len(developer['Тип дома']):
-                params['Тип дома'] = developer['Тип дома']
-        rosreestr = res.get('rosreestr') or {}
-        agent = res.get('agent') or {}
-        images = res.get('images') or []
-        description = res.get('description', 'Описание отсутствует.')
-        # ic(offer)
-        # ic(metro_list)
-        # ic(params)
-        # ic(author_branding)
-        # ic(offer_metadata)
-        # ic(developer)
-        # ic(rosreestr)
-        # ic(agent)
-        # ic(description)
-
-        # Форматирование списка метро
-        metro_html = ""
-        if metro_list:
-            metro_items = []
-            for station_info in metro_list:
-                station = station_info.get('station', '?')
-                method = station_info.get('method', '')
-                time = station_info.get('time', '')
-                metro_items.append(f'<i class="bi bi-geo-alt-fill text-success"></i> {station} ({method} {time})')
-            metro_html = " ".join(metro_items)
-        else:
-            metro_html = "Нет данных о метро"
-
-        # Форматирование изображений
-        # HTML-шаблон предполагает, что ФОТОГРАФИИ вставляются внутрь <tr> ... </tr>
-        # Поэтому генерируем <td> элементы.
-        images_html_parts = []
-        if images:
-            # Отображаем до 3х картинок
-            images_to_display = images[:3]
-            for i, img_path in enumerate(images_to_display):
-                if img_path:
-                    try:
-                        img_src = f"file:///{img_path.replace(os.sep, '/')}"
-                        images_html_parts.append(f'''
-                                <td style="padding: 0.5rem; text-align: center;">
-                                  <img src="{img_src}" style="width:280px;" alt="Фото {i + 1}">
-                                </td>''')
-                    except Exception as e:
-                        printer(f"[create_report_cian] Ошибка обработки пути изображения '{img_path}' в отчете: {e}", kind='error')
-                else:
-                    # Что делать, если изображение не скачалось?
-                    # Можно пропустить, можно добавить плейсхолдер в отчет
-                    printer("[create_report_cian] Пропуск отсутствующего изображения (None) при создании отчета.", kind='info')
-                    # Например, добавить пустую строку или сообщение об ошибке в HTML/PDF
-                    # html_content += "<p><i>Изображение не загружено</i></p>"
-            # Если картинок меньше 3, и мы хотим занимать все 3 колонки (например, для выравнивания)
-            # можно добавить пустые <td>. Но текущий HTML этого не требует явно.
-            # while len(images_html_parts) < 3 and len(images_html_parts) > 0:
-            #     images_html_parts.append('<td></td>') # Пустая ячейка для выравнивания
-
-        if not images_html_parts:  # Если список пуст (не было картинок или images был пуст)
-            images_html = '<td colspan="3"><p>Фотографии отсутствуют.</p></td>'
-        else:
-            images_html = "".join(images_html_parts)
+def _lines(value, source):
+    """'1 пассажирский, 1 грузовой' -> по строке на элемент."""
+    if value in EMPTY_VALUES_FOR_HIDE:
+        return None
+    return value.replace(',', '<br>')
 
-        # Обработка описания: замена переносов строк на <br> и удаление лишних пробелов
-        cleaned_description = re.sub(r'\s+', ' ', description).strip()
-        cleaned_description = cleaned_description.replace('\n', '<br>').replace('\r', '')
-        cleaned_description = cleaned_description.replace('\t', ' ')
 
-        # Извлечение этажа и этажности
-        floor_info = params.get('Этаж', ' / ')
-        try:
-            floor, total_floors = floor_info.split(' из ')
-            floor = floor.strip()
-            total_floors = total_floors.strip()
-        except ValueError:
-            floor = floor_info
-            total_floors = '?'
+def _complex_deadline(value, source):
+    """'Сдача в 2027—2029' -> ' 2027—2029 г.'"""
+    if value in EMPTY_VALUES_FOR_HIDE:
+        return None
+    return f"{value.replace('Сдача в', '')} г."
 
-        # --- Список замен ---
-        EMPTY_VALUES_FOR_HIDE = ['?', None, '', 'Не указано', 'Не указана', 'Нет данных']
 
-        # --- Функции для генерации HTML строк для таблицы деталей ---
-        # (Эти функции теперь получают словари params или rosreestr, которые гарантированно являются dict)
+def _developer_since(value, source):
+    """Застройщик с годом основания, если он известен: 'ГК Юникей (c 2018)'."""
+    if value in EMPTY_VALUES_FOR_HIDE:
+        return None
+    year = source.get('Год основания')
+    return f'{value} (c {year})' if year not in EMPTY_VALUES_FOR_HIDE else value
 
-        def generate_developer_info_row(params_dict):
-            if params_dict != {}:
-                developer_info = params_dict.get('Застройщик', 'н/д')
-                developer_year_info = params_dict.get('Год основания', 'н/д')
-                bilded_info = params_dict.get('Сдано', 'н/д')
-                bilding_info = params_dict.get('Строится', 'н/д')
 
-                return f"""<h4 class="section-title fw-bold">О застройщике</h4>
+def _floor(value, source):
+    """'2 из 27' -> '2 из 27'; без этажности - только этаж; без этажа - '? из 27'."""
+    # Без ключа 'Этаж' строка выводится с ' / ', как и раньше
+    floor_info = value if value is not None else ' / '
+    try:
+        floor, total_floors = (part.strip() for part in floor_info.split(' из '))
+    except ValueError:
+        floor, total_floors = floor_info, '?'
+    floor = floor if floor not in EMPTY_VALUES_FOR_HIDE else None
+    total_floors = total_floors if total_floors not in EMPTY_VALUES_FOR_HIDE else None
+    if floor and total_floors:
+        return f'{floor} из {total_floors}'
+    if floor:
+        return floor
+    if total_floors:
+        return f'? из {total_floors}'
+    return None
+
+
+# Строки таблиц деталей: (плейсхолдер, словарь-источник, ключ, единица измерения, подпись, форматирование).
+# Источник - 'params', 'rosreestr' или 'developer'. Строка выводится, если значение не из EMPTY_VALUES_FOR_HIDE;
+# форматирование - функция (значение, словарь-источник) -> текст ячейки или None (строку не выводить),
+# она получает и пустые значения.
+# Новое поле отчёта - одна строка здесь и плейсхолдер в cian7.html (и в REPORT_PLACEHOLDERS).
+DETAIL_ROWS = (
+    ('ОБЩАЯ_ПЛОЩАДЬ_ROW', 'params', 'Общая площадь', 'м²', 'Общая площадь', None),
+    ('ЖИЛАЯ_ПЛОЩАДЬ_ROW', 'params', 'Жилая площадь', 'м²', 'Жилая площадь', None),
+    ('ПЛОЩАДЬ_КУХНИ_ROW', 'params', 'Площадь кухни', 'м²', 'Площадь кухни', None),
+    ('ВЫСОТА_ПОТОЛКОВ_ROW', 'params', 'Высота потолков', 'м', 'Высота потолков', None),
+    ('ЭТАЖ_ROW', 'params', 'Этаж', None, 'Этаж', _floor),
+    ('БАЛКОН_ROW', 'params', 'Балкон/лоджия', None, 'Балкон/лоджия', None),
+    ('РЕМОНТ_ROW', 'params', 'Ремонт', None, 'Отделка/Ремонт', None),
+    ('ОТДЕЛКА_ROW', 'params', 'Отделка', None, 'Отделка', None),
+    ('САНУЗЕЛ_ROW', 'params', 'Санузел', None, 'Санузел', None),
+    ('ВИД_ИЗ_ОКОН_ROW', 'params', 'Вид из окон', None, 'Вид из окон', None),
+    ('СОБСТВЕННИКОВ_ROW', 'rosreestr', 'Собственников', None, 'Собственников', None),
+    ('ОБРЕМЕНЕНИЯ_ROW', 'rosreestr', 'Обременения', None, 'Обременения', None),
+    ('МЕБЕЛЬ_ROW', 'params', 'Продаётся с\xa0мебелью', None, 'Продаётся с мебелью', None),
+    ('КАДАСТРОВЫЙ_НОМЕР_ROW', 'rosreestr', 'Кадастровый номер', None, 'Кадастровый номер', None),
+
+    ('ТИП_ДОМА_ROW', 'params', 'Тип дома', None, 'Тип дома', None),
+    ('ТИП_ПЕРЕКРЫТИЙ_ROW', 'params', 'Тип перекрытий', None, 'Тип перекрытий', None),
+    ('СТРОИТЕЛЬНАЯ_СЕРИЯ_ROW', 'params', 'Строительная серия', None, 'Строительная серия', None),
+    ('КОЛИЧЕСТВО_ЛИФТОВ_ROW', 'params', 'Количество лифтов', None, 'Лифт', _lines),
+    ('ПОДЪЕЗДЫ_ROW', 'params', 'Подъезды', None, 'Подъезды', None),
+    ('МУСОРОПРОВОД_ROW', 'params', 'Мусоропровод', None, 'Мусоропровод', None),
+    ('ПАРКОВКА_ROW', 'params', 'Парковка', None, 'Парковка', _lines),
+    ('ОТОПЛЕНИЕ_ROW', 'params', 'Отопление', None, 'Отопление', None),
+    ('АВАРИЙНОСТЬ_ROW', 'params', 'Аварийность', None, 'Аварийность', None),
+    ('ГАЗОСНАБЖЕНИЕ_ROW', 'params', 'Газоснабжение', None, 'Газоснабжение', None),
+
+    ('ЗАСТРОЙЩИК_ROW', 'developer', 'Застройщик', None, 'Застройщик', _developer_since),
+    ('КЛАСС_ДОМА_ROW', 'developer', 'Класс', None, 'Класс', None),
+    ('ЗДАЧА_КОМПЛЕКСА_ROW', 'developer', 'Сдача комплекса', None, 'Сдача комплекса', _complex_deadline),
+    ('ТИП_КОМПЛЕКСА_ROW', 'developer', 'Тип комплекса', None, 'Тип комплекса', None),
+)
+
+# Подписи с единицами измерения считаются один раз: 'Общая площадь' + 'м²' -> 'Общая площадь, м²'
+_ROW_LABELS = {placeholder: f'{label}, {unit}' if unit else label
+               for placeholder, _, _, unit, label, _ in DETAIL_ROWS}
+
+
+def render_detail_rows(sources):
+    """
+    Отрисовывает все строки DETAIL_ROWS за один проход по таблице.
+    sources - {'params': {...}, 'rosreestr': {...}, 'developer': {...}}.
+    Возвращает {плейсхолдер: HTML строки или ''}.
+    """
+    rows = {}
+    for placeholder, source_name, key, _, _, formatter in DETAIL_ROWS:
+        source = sources[source_name]
+        value = source.get(key)
+        if formatter is not None:
+            value = formatter(value, source)
+        rows[placeholder] = ROW_HTML.format(label=_ROW_LABELS[placeholder], value=value) \
+            if value not in EMPTY_VALUES_FOR_HIDE else ''
+    return rows
+
+
+def generate_developer_info_row(developer):
+    """Блок 'О застройщике' (четыре колонки) или '', если данных застройщика нет."""
+    if not developer:
+        return ''
+    return f"""<h4 class="section-title fw-bold">О застройщике</h4>
                             <table style="width: 100%;">
                                 <tr>
                                     <td style="width: 25%;" class="detail-item">
                                         <div class="label">Застройщик</div>
-                                        <div class="value">{developer_info}</div>
+                                        <div class="value">{developer.get('Застройщик', 'н/д')}</div>
                                     </td>
                                     <td style="width: 25%;" class="detail-item">
                                         <div class="label">Год основания</div>
-                                        <div class="value">{developer_year_info}</div>
+                                        <div class="value">{developer.get('Год основания', 'н/д')}</div>
                                     </td>
                                     <td style="width: 25%;" class="detail-item">
                                         <div class="label">Сдано</div>
-                                        <div class="value">{bilded_info}</div>
+                                        <div class="value">{developer.get('Сдано', 'н/д')}</div>
                                     </td>
                                     <td style="width: 25%;" class="detail-item">
                                         <div class="label">Строится</div>
-                                        <div class="value">{bilding_info}</div>
+                                        <div class="value">{developer.get('Строится', 'н/д')}</div>
                                     </td>
                                 </tr>
                             </table>"""
-            return ''
-
-        def generate_developer_year_row(params_dict):
-            value = params_dict.get('Год основания')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f""" (c {value})"""
-            return ''
-
-        def generate_developer_row(params_dict):
-            value = params_dict.get('Застройщик')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Застройщик</span></td>
-                                <td class="value-cell"><span class="value">{value}{generate_developer_year_row(params_dict)}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_data_complex_row(params_dict):
-            value = params_dict.get('Сдача комплекса')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Сдача комплекса</span></td>
-                                <td class="value-cell"><span class="value">{value.replace('Сдача в', '')} г.</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_complex_type_row(params_dict):
-            value = params_dict.get('Тип комплекса')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Тип комплекса</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_class_row(params_dict):
-            value = params_dict.get('Класс')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Класс</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_otdelka_row(params_dict):
-            # ic(params_dict)
-            value = params_dict.get('Отделка')
-            # ic(params_dict.get('Отделка'))
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Отделка</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_total_area_row(params_dict):
-            value = params_dict.get('Общая площадь')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Общая площадь, м²</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
 
-        def generate_living_area_row(params_dict):
-            value = params_dict.get('Жилая площадь')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Жилая площадь, м²</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
 
-        def generate_kitchen_area_row(params_dict):
-            value = params_dict.get('Площадь кухни')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Площадь кухни, м²</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_ceiling_height_row(params_dict):
-            value = params_dict.get('Высота потолков')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Высота потолков, м</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_floor_info_row(floor_val, total_floors_val):
-            floor_str = str(floor_val) if floor_val not in EMPTY_VALUES_FOR_HIDE else None
-            total_floors_str = str(total_floors_val) if total_floors_val not in EMPTY_VALUES_FOR_HIDE else None
-
-            if floor_str and total_floors_str:
-                value_display = f"{floor_str} из {total_floors_str}"
-            elif floor_str:
-                value_display = floor_str
-            elif total_floors_str:
-                value_display = f"? из {total_floors_str}"
+def build_report_values(res):
+    """
+    Значения всех плейсхолдеров шаблона отчёта (REPORT_PLACEHOLDERS) для словаря результата res.
+    Только подготовка данных: файлы не пишутся, res не изменяется.
+    """
+    # Безопасное извлечение данных. Используем `res.get(key) or default`,
+    # чтобы обработать случаи, когда значение по ключу в res может быть None.
+    offer = res.get('offer') or {}
+    metro_list = res.get('metro') or []
+    # Копия: ниже params дополняется данными застройщика, а res не должен меняться
+    params = dict(res.get('params') or {})
+    author_branding = res.get('author_branding') or {}
+    offer_metadata = res.get('offer_metadata') or {}
+    developer = res.get('developer') or {}
+    if 'Отделка' in developer:
+        Dash_square = '''
+        <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" class="bi bi-dash-square" viewBox="0 0 16 16">
+          <path d="M14 1a1 1 0 0 1 1 1v12a1 1 0 0 1-1 1H2a1 1 0 0 1-1-1V2a1 1 0 0 1 1-1zM2 0a2 2 0 0 0-2 2v12a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V2a2 2 0 0 0-2-2z"/>
+          <path d="M4 8a.5.5 0 0 1 .5-.5h7a.5.5 0 0 1 0 1h-7A.5.5 0 0 1 4 8"/>
+        </svg>
+        '''
+        Empty_square = '''
+        <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" class="bi bi-square" viewBox="0 0 16 16">
+          <path d="M14 1a1 1 0 0 1 1 1v12a1 1 0 0 1-1 1H2a1 1 0 0 1-1-1V2a1 1 0 0 1 1-1zM2 0a2 2 0 0 0-2 2v12a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V2a2 2 0 0 0-2-2z"/>
+        </svg>
+        '''
+        Check_square = '''
+        <svg xmlns="http://www.w3.org/2000/svg" width="16" height="16" fill="currentColor" class="bi bi-check-square" viewBox="0 0 16 16">
+          <path d="M14 1a1 1 0 0 1 1 1v12a1 1 0 0 1-1 1H2a1 1 0 0 1-1-1V2a1 1 0 0 1 1-1zM2 0a2 2 0 0 0-2 2v12a2 2 0 0 0 2 2h12a2 2 0 0 0 2-2V2a2 2 0 0 0-2-2z"/>
+          <path d="M10.97 4.97a.75.75 0 0 1 1.071 1.05l-3.992 4.99a.75.75 0 0 1-1.08.02L4.324 8.384a.75.75 0 1 1 1.06-1.06l2.094 2.093 3.473-4.425z"/>
+        </svg>
+        '''
+        otdelka = developer['Отделка'].lower().split(',')
+        otdelka_new = []
+        for i in otdelka:
+            if i == params['Отделка'].lower():
+                otdelka_new.append(f"{Check_square}{i}")
             else:
-                return ''
-
-            return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Этаж</span></td>
-                                <td class="value-cell"><span class="value">{value_display}</span></td>
-                            </tr>"""
-
-        def generate_balcon_row(params_dict):
-            value = params_dict.get('Балкон/лоджия')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Балкон/лоджия</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_renovation_row(params_dict):
-            value = params_dict.get('Ремонт')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Отделка/Ремонт</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_bathroom_row(params_dict):
-            value = params_dict.get('Санузел')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Санузел</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_window_view_row(params_dict):
-            value = params_dict.get('Вид из окон')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Вид из окон</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_furniture_status_row(params_dict):
-            value = params_dict.get('Продаётся с\xa0мебелью')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Продаётся с мебелью</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_house_type_row(params_dict):
-            value = params_dict.get('Тип дома')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Тип дома</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_flooring_type_row(params_dict):
-            value = params_dict.get('Тип перекрытий')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Тип перекрытий</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_building_series_row(params_dict):
-            value = params_dict.get('Строительная серия')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Строительная серия</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
+                otdelka_new.append(f"{Empty_square}{i}")
+        params['Отделка'] = '<br>'.join(otdelka_new)
+        # params['Отделка'] = developer['Отделка'].lower().replace(', ', '<br>').replace(params['Отделка'].lower(),f"<b>{params['Отделка'].lower()}</b>").capitalize()
+    if 'Парковка' in params and 'Парковка' in developer:
+        if len(params['Парковка']) < len(developer['Парковка']):
+            params['Парковка'] = developer['Парковка']
+    if 'Тип дома' in params and 'Тип дома' in developer:
+        if len(params['Тип дома']) < len(developer['Тип дома']):
+            params['Тип дома'] = developer['Тип дома']
+    rosreestr = res.get('rosreestr') or {}
+    agent = res.get('agent') or {}
+    images = res.get('images') or []
+    description = res.get('description', 'Описание отсутствует.')
+    # ic(offer)
+    # ic(metro_list)
+    # ic(params)
+    # ic(author_branding)
+    # ic(offer_metadata)
+    # ic(developer)
+    # ic(rosreestr)
+    # ic(agent)
+    # ic(description)
+
+    # Форматирование списка метро
+    metro_html = ""
+    if metro_list:
+        metro_items = []
+        for station_info in metro_list:
+            station = station_info.get('station', '?')
+            method = station_info.get('method', '')
+            time = station_info.get('time', '')
+            how = ' '.join(part for part in (method, time) if part)
+            metro_items.append(f'{METRO_ICON} {station} ({how})' if how else f'{METRO_ICON} {station}')
+        metro_html = " ".join(metro_items)
+    else:
+        metro_html = "Нет данных о метро"
+
+    # Форматирование изображений
+    # HTML-шаблон предполагает, что ФОТОГРАФИИ вставляются внутрь <tr> ... </tr>
+    # Поэтому генерируем <td> элементы.
+    images_html_parts = []
+    if images:
+        # Отображаем до REPORT_IMAGES картинок (столько же скачивается сразу, см. parser_cian.images)
+        images_to_display = images[:REPORT_IMAGES]
+        for i, img_path in enumerate(images_to_display):
+            if img_path:
+                try:
+                    # В PDF встраиваем уменьшенную копию под ширину в отчёте, а не оригинал
+                    img_path = report_thumbnail(img_path)
+                    img_src = f"file:///{img_path.replace(os.sep, '/')}"
+                    images_html_parts.append(f'''
+                            <td style="padding: 0.5rem; text-align: center;">
+                              <img src="{img_src}" style="width:{REPORT_IMAGE_WIDTH}px;" alt="Фото {i + 1}">
+                            </td>''')
+                except Exception as e:
+                    printer(f"[create_report_cian] Ошибка обработки пути изображения '{img_path}' в отчете: {e}", kind='error')
+            else:
+                # Что делать, если изображение не скачалось?
+                # Можно пропустить, можно добавить плейсхолдер в отчет
+                printer("[create_report_cian] Пропуск отсутствующего изображения (None) при создании отчета.", kind='info')
+                # Например, добавить пустую строку или сообщение об ошибке в HTML/PDF
+                # html_content += "<p><i>Изображение не загружено</i></p>"
+        # Если картинок меньше 3, и мы хотим занимать все 3 колонки (например, для выравнивания)
+        # можно добавить пустые <td>. Но текущий HTML этого не требует явно.
+        # while len(images_html_parts) < 3 and len(images_html_parts) > 0:
+        #     images_html_parts.append('<td></td>') # Пустая ячейка для выравнивания
+
+    if not images_html_parts:  # Если список пуст (не было картинок или images был пуст)
+        images_html = '<td colspan="3"><p>Фотографии отсутствуют.</p></td>'
+    else:
+        images_html = "".join(images_html_parts)
+
+    # Обработка описания: замена переносов строк на <br> и удаление лишних пробелов
+    cleaned_description = re.sub(r'\s+', ' ', description).strip()
+    cleaned_description = cleaned_description.replace('\n', '<br>').replace('\r', '')
+    cleaned_description = cleaned_description.replace('\t', ' ')
+
+    values = {
+        'DATE_TAME_ROW': datetime.datetime.now().strftime("%d.%m.%Y в %H:%M:%S"),
+        'ОБНОВЛЕНО_ROW': offer_metadata.get('updated_date', 'Не указано'),
+        'ПРОСМОТРЫ_ROW': offer_metadata.get('views_stats', 'Не указано'),
+        'ИМЯ_РИЕЛТОРА': os.getenv("NAME", "Имя не указано"),
+        'ТЕЛЕФОН_РИЕЛТОРА': os.getenv("PHONE", "Телефон не указан"),
+        'НАЗВАНИЕ': res.get('title', 'Без названия').replace('Продается', ''),
+        'АДРЕС': res.get('adress', 'Адрес не указан'),
+        'ТИП_ЖИЛЬЯ': params.get('Тип жилья', 'Тип не указан'),
+        'СТОИМОСТЬ': format_price(res.get('price', 'Цена не указана')),
+        'МЕТРО': metro_html,
+        'ЦЕНА_ЗА_МЕТР': format_price(offer.get('Цена за метр', 'Не указано')),
+        'УСЛОВИЯ_СДЕЛКИ': (offer.get('Условия сделки') or params.get('Дом') or 'Не указано').capitalize(),
+        'ИПОТЕКА': offer.get('Ипотека', 'Не указано'),
+        'ФОТОГРАФИИ': images_html,
+        'ГОД_ПОСТРОЙКИ': params.get('Год постройки', params.get('Год сдачи', 'Не указан')),
+        'ОПИСАНИЕ': cleaned_description,
+    }
+    # Строки таблиц деталей - по таблице DETAIL_ROWS, блок о застройщике - отдельной функцией
+    values.update(render_detail_rows({'params': params, 'rosreestr': rosreestr, 'developer': developer}))
+    values['О_ЗАСТРОЙЩИКЕ_INFO'] = generate_developer_info_row(developer)
+    return values
 
-        def generate_mosquito_net_row(params_dict):
-            value = params_dict.get('Мусоропровод')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Мусоропровод</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_elevator_count_row(params_dict):
-            value = params_dict.get('Количество лифтов')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Лифт</span></td>
-                                <td class="value-cell"><span class="value">{value.replace(',', '<br>')}</span></td>
-                            </tr>"""
-            return ''
 
-        def generate_entrances_row(params_dict):
-            value = params_dict.get('Подъезды')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Подъезды</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        def generate_parking_row(params_dict):
-            value = params_dict.get('Парковка')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Парковка</span></td>
-                                <td class="value-cell"><span class="value">{value.replace(',', '<br>')}</span></td>
-                            </tr>"""
-            return ''
+def render_report_cian(res):
+    """
+    Собирает HTML-отчет по шаблону cian7.html и данным из словаря res и возвращает его строкой,
+    ничего не записывая на диск. При ошибке возвращает None.
+    """
+    try:
+        template = load_template(REPORT_TEMPLATE_PATH, REPORT_PLACEHOLDERS)
+        # Все плейсхолдеры подставляются за один проход по разобранному шаблону
+        return template.render(build_report_values(res))
 
-        def generate_heating_row(params_dict):
-            value = params_dict.get('Отопление')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Отопление</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
+    except FileNotFoundError:
+        printer(f"[create_cian] Ошибка: Шаблон не найден по пути {REPORT_TEMPLATE_PATH}", kind='error')
+        return None
+    except KeyError as e:
+        printer(f"[create_cian] Ошибка: Отсутствует необходимый ключ в словаре 'res': {e}", kind='error')
+        traceback.print_exc()
+        return None
+    except Exception as e:
+        printer(f"[create_cian] Произошла непредвиденная ошибка при создании отчета: {e}", kind='error')
+        traceback.print_exc()
+        return None
 
-        def generate_emergency_status_row(params_dict):
-            value = params_dict.get('Аварийность')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Аварийность</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
 
-        def generate_gas_status_row(params_dict):
-            value = params_dict.get('Газоснабжение')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Газоснабжение</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-        # Функции для Росреестра
-        def generate_saler_status_row(rosreestr_dict):  # Получает rosreestr
-            value = rosreestr_dict.get('Собственников')  # Исправлен ключ
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Собственников</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
+def create_report_cian(res, cian_number):
+    """
+    Создает HTML-отчет на основе шаблона cian.html и данных из словаря res
+    и сохраняет его в downloads/<cian_number>/index.html.
 
-        def generate_peoples_status_row(rosreestr_dict):  # Получает rosreestr
-            value = rosreestr_dict.get('Обременения')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Обременения</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
+    Args:
+        res (dict): Словарь с данными для заполнения шаблона.
+        cian_number (str): Номер объявления Cian, используется для создания пути.
+    """
+    header_index, footer_index = create_header_and_footer()
 
-        def generate_kadaster_status_row(rosreestr_dict):  # Получает rosreestr
-            value = rosreestr_dict.get('Кадастровый номер')
-            if value not in EMPTY_VALUES_FOR_HIDE:
-                return f"""<tr class="detail-item">
-                                <td class="label-cell"><span class="label">Кадастровый номер</span></td>
-                                <td class="value-cell"><span class="value">{value}</span></td>
-                            </tr>"""
-            return ''
-
-
-
-        replace_list = [
-            ('DATE_TAME_ROW', datetime.datetime.now().strftime("%d.%m.%Y в %H:%M:%S")),
-            ('ОБНОВЛЕНО_ROW', offer_metadata.get('updated_date', 'Не указано')),
-            ('ПРОСМОТРЫ_ROW', offer_metadata.get('views_stats', 'Не указано')),
-            ('ИМЯ_РЕЕЛТОРА', os.getenv("NAME", "Имя не указано")),
-            ('ТЕЛЕФОН_РИЕЛТОРА', os.getenv("PHONE", "Телефон не указан")),
-            ('НАЗВАНИЕ', res.get('title', 'Без названия').replace('Продается', '')),
-            ('АДРЕС', res.get('adress', 'Адрес не указан')),
-            ('ТИП_ЖИЛЬЯ', params.get('Тип жилья', 'Тип не указан')),
-            ('СТОИМОСТЬ', format_price(res.get('price', 'Цена не указана'))),
-            ('МЕТРО', metro_html),
-            ('ЦЕНА_ЗА_МЕТР', format_price(offer.get('Цена за метр', 'Не указано'))),
-            ('УСЛОВИЯ_СДЕЛКИ', (offer.get('Условия сделки') or params.get('Дом') or 'Не указано').capitalize()),
-            ('ИПОТЕКА', offer.get('Ипотека', 'Не указано')),
-            ('ФОТОГРАФИИ', images_html),
-            ('ГОД_ПОСТРОЙКИ', params.get('Год постройки', params.get('Год сдачи', 'Не указан'))),
-            ('ОПИСАНИЕ', cleaned_description),
-            # ('ФОТООТЧЁТ', images_html), # Плейсхолдер отсутствует в cian7.html
-
-            ('ОБЩАЯ_ПЛОЩАДЬ_ROW', generate_total_area_row(params)),
-            ('ЖИЛАЯ_ПЛОЩАДЬ_ROW', generate_living_area_row(params)),
-            ('ПЛОЩАДЬ_КУХНИ_ROW', generate_kitchen_area_row(params)),
-            ('ВЫСОТА_ПОТОЛКОВ_ROW', generate_ceiling_height_row(params)),
-            ('ЭТАЖ_ROW', generate_floor_info_row(floor, total_floors)),
-            ('БАЛКОН_ROW', generate_balcon_row(params)),
-            ('РЕМОНТ_ROW', generate_renovation_row(params)),
-            ('ОТДЕЛКА_ROW', generate_otdelka_row(params)),
-            ('САНУЗЕЛ_ROW', generate_bathroom_row(params)),
-            ('ВИД_ИЗ_ОКОН_ROW', generate_window_view_row(params)),
-            ('СОБСТВЕННИКОВ_ROW', generate_saler_status_row(rosreestr)),
-            ('ОБРЕМЕНЕНИЯ_ROW', generate_peoples_status_row(rosreestr)),
-            ('МЕБЕЛЬ_ROW', generate_furniture_status_row(params)),  # Продаётся с мебелью
-            ('КАДАСТРОВЫЙ_НОМЕР_ROW', generate_kadaster_status_row(rosreestr)),
-
-            ('ТИП_ДОМА_ROW', generate_house_type_row(params)),
-            ('ТИП_ПЕРЕКРЫТИЙ_ROW', generate_flooring_type_row(params)),
-            ('СТРОИТЕЛЬНАЯ_СЕРИЯ_ROW', generate_building_series_row(params)),
-            ('КОЛИЧЕСТВО_ЛИФТОВ_ROW', generate_elevator_count_row(params)),
-            ('ПОДЪЕЗДЫ_ROW', generate_entrances_row(params)),
-            ('МУСОРОПРОВОД_ROW', generate_mosquito_net_row(params)),
-            ('ПАРКОВКА_ROW', generate_parking_row(params)),
-            ('ОТОПЛЕНИЕ_ROW', generate_heating_row(params)),
-            ('АВАРИЙНОСТЬ_ROW', generate_emergency_status_row(params)),
-            ('ГАЗОСНАБЖЕНИЕ_ROW', generate_gas_status_row(params)),
-
-            ('ЗАСТРОЙЩИК_ROW', generate_developer_row(developer)),
-            ('КЛАСС_ДОМА_ROW', generate_class_row(developer)),
-            ('ЗДАЧА_КОМПЛЕКСА_ROW', generate_data_complex_row(developer)),
-            ('ТИП_КОМПЛЕКСА_ROW', generate_complex_type_row(developer)),
-            ('О_ЗАСТРОЙЩИКЕ_INFO', generate_developer_info_row(developer)),
-        ]
+    # Убедимся, что директория для cian_number существует или создаем ее
+    output_dir = os.path.join(downloads_dir_absolute, str(cian_number))
+    os.makedirs(output_dir, exist_ok=True)
 
-        for placeholder, value in replace_list:
-            template = template.replace(placeholder, str(value))
+    output_filename = 'index.html'  # Имя выходного файла
+    output_path = os.path.join(output_dir, output_filename)
 
+    html = render_report_cian(res)
+    if html is None:
+        return None
+    try:
         with open(file=output_path, mode='w', encoding='utf8') as f:
-            f.write(template)
+            f.write(html)
         printer(f"[create_cian] Отчет успешно создан и сохранен в: {output_path}", kind='info')
-
         return output_path, header_index, footer_index
-
-    except FileNotFoundError:
-        printer(f"[create_cian] Ошибка: Шаблон не найден по пути {tempfile_path}", kind='error')
-        return None
-    except KeyError as e:
-        printer(f"[create_cian] Ошибка: Отсутствует необходимый ключ в словаре 'res': {e}", kind='error')
-        traceback.print_exc()
+    except OSError as e:
+        printer(f"[create_cian] Ошибка записи отчета {output_path}: {e}", kind='error')
         return None
+
+
+# --- Отчёт-сравнение нескольких объявлений ---
+
+def _compare_area(res, values):
+    area = (res.get('params') or {}).get('Общая площадь')
+    return f'{area} м²' if area not in EMPTY_VALUES_FOR_HIDE else 'Не указана'
+
+
+def _compare_floor(res, values):
+    floor_info = (res.get('params') or {}).get('Этаж')
+    return (_floor(floor_info, None) if floor_info else None) or 'Не указан'
+
+
+def _compare_metro(res, values):
+    """Ближайшая станция: '5 мин. пешком (Бунинская аллея)'."""
+    nearest = None
+    for station_info in res.get('metro') or []:
+        match = re.search(r'\d+', station_info.get('time') or '')
+        if match and (nearest is None or int(match.group()) < nearest[0]):
+            nearest = int(match.group()), station_info
+    if nearest is None:
+        return 'Нет данных'
+    minutes, station_info = nearest
+    return f"{minutes} мин. {station_info.get('method', '')} ({station_info.get('station', '?')})"
+
+
+# Строки таблицы сравнения: (подпись, значение). Значение - плейсхолдер отчёта из build_report_values()
+# или функция (res, значения отчёта) -> текст ячейки.
+COMPARISON_ROWS = (
+    ('Цена', 'СТОИМОСТЬ'),
+    ('Цена за м²', 'ЦЕНА_ЗА_МЕТР'),
+    ('Общая площадь', _compare_area),
+    ('Этаж', _compare_floor),
+    ('Метро', _compare_metro),
+    ('Год постройки', 'ГОД_ПОСТРОЙКИ'),
+)
+
+
+def render_comparison_table(results, values_list):
+    """Раздел с таблицей сравнения: колонка на объявление, строки из COMPARISON_ROWS."""
+    header = ''.join(f'<th>№{number} {values["НАЗВАНИЕ"]}<br><span class="label">{values["АДРЕС"]}</span></th>'
+                     for number, values in enumerate(values_list, start=1))
+    rows = []
+    for label, source in COMPARISON_ROWS:
+        cells = ''.join(f'<td>{source(res, values) if callable(source) else values[source]}</td>'
+                        for res, values in zip(results, values_list))
+        rows.append(f'<tr><td class="label">{label}</td>{cells}</tr>')
+    return f"""<div class="container">
+    <h4 class="section-title fw-bold">Сравнение объявлений</h4>
+    <table class="comparison-table">
+        <tr><th></th>{header}</tr>
+        {''.join(rows)}
+    </table>
+</div>"""
+
+
+def render_comparison_cian(results):
+    """
+    Собирает один HTML-документ для сравнения нескольких объявлений: таблица сравнения
+    (COMPARISON_ROWS), затем полный отчёт по каждому объявлению с новой страницы.
+    Отчёты собираются по тому же шаблону cian7.html, что и одиночные: стили берутся из него один раз,
+    а тела отчётов идут подряд, поэтому весь документ собирается одним запуском wkhtmltopdf.
+    При ошибке возвращает None.
+    """
+    try:
+        template = load_template(REPORT_TEMPLATE_PATH, REPORT_PLACEHOLDERS)
+        values_list = [build_report_values(res) for res in results]
+        documents = [template.render(values) for values in values_list]
+        head, _, _ = documents[0].partition('<body>')
+        bodies = [document.partition('<body>')[2].rpartition('</body>')[0] for document in documents]
+        pages = ''.join(f'\n<div class="page-break-before"></div>\n{body}' for body in bodies)
+        return f'{head}<body>\n{render_comparison_table(results, values_list)}{pages}\n</body>\n</html>'
+
     except Exception as e:
-        printer(f"[create_cian] Произошла непредвиденная ошибка при создании отчета: {e}", kind='error')
+        printer(f"[create_cian] Ошибка при создании отчета-сравнения: {e}", kind='error')
         traceback.print_exc()
         return None
 
@@ -0,0 +1,124 @@
+import threading
+from contextlib import asynccontextmanager
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+from servise import printer
+from rate_limiter import get_limiter
+from settings import (
+    HTTP_POOL_CONNECTIONS,
+    HTTP_POOL_MAXSIZE,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_READ_TIMEOUT,
+    HTTP_KEEPALIVE_TIMEOUT,
+)
+
+# Общая для всего процесса сессия requests.
+# Session переиспользует TCP/TLS соединения (keep-alive), поэтому запросы к www.cian.ru
+# и images.cdn-cian.ru не тратят время на новое рукопожатие для каждой страницы и фотографии.
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """
+    Возвращает общую сессию requests с пулом соединений.
+    Сессия создаётся один раз при первом обращении.
+
+    pool_connections - сколько разных хостов держим в пуле,
+    pool_maxsize - сколько соединений одновременно открыто к одному хосту.
+    pool_block=True не даёт превысить лимит соединений на хост: лишние запросы ждут
+    освобождения соединения, а не открывают новое.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=HTTP_POOL_CONNECTIONS,
+                    pool_maxsize=HTTP_POOL_MAXSIZE,
+                    pool_block=True,
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers['Connection'] = 'keep-alive'
+                _session = session
+                printer(f'[http_client] Создана сессия: {HTTP_POOL_CONNECTIONS} хостов, '
+                        f'{HTTP_POOL_MAXSIZE} соединений на хост', kind='info')
+    return _session
+
+
+def fetch(url, **kwargs):
+    """
+    Выполняет GET-запрос через общую сессию.
+    Если таймаут не передан явно, используется (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT) из settings.
+    Остальные аргументы передаются в requests.Session.get без изменений (cookies, headers, stream...).
+    Перед запросом ждёт токен лимитера хоста (rate_limiter), после - сообщает ему код ответа.
+    """
+    kwargs.setdefault('timeout', (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+    limiter = get_limiter(url)
+    if limiter:
+        limiter.acquire()
+    response = get_session().get(url, **kwargs)
+    if limiter:
+        limiter.feedback(response.status_code, response.headers.get('Retry-After'))
+    return response
+
+
+def close_session():
+    """Закрывает общую сессию и все соединения пула."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+# Асинхронный вариант для бота: одна aiohttp-сессия на event loop бота.
+# Создаётся лениво внутри работающего loop (aiohttp требует этого) и закрывается при остановке бота.
+_async_session = None
+
+
+def get_async_session():
+    """
+    Возвращает общую aiohttp-сессию с пулом соединений.
+    Лимиты те же, что и у синхронной сессии: всего HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE соединений,
+    не более HTTP_POOL_MAXSIZE на один хост. Вызывать только из работающего event loop.
+    """
+    global _async_session
+    if _async_session is None or _async_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_CONNECTIONS * HTTP_POOL_MAXSIZE,
+            limit_per_host=HTTP_POOL_MAXSIZE,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+        )
+        timeout = aiohttp.ClientTimeout(sock_connect=HTTP_CONNECT_TIMEOUT, sock_read=HTTP_READ_TIMEOUT)
+        _async_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        printer(f'[http_client] Создана aiohttp-сессия: {HTTP_POOL_MAXSIZE} соединений на хост', kind='info')
+    return _async_session
+
+
+@asynccontextmanager
+async def fetch_async(url, **kwargs):
+    """
+    Асинхронный аналог fetch(). Используется как контекстный менеджер ответа aiohttp:
+
+        async with fetch_async(url, headers=headers) as response:
+            html = await response.text()
+    """
+    limiter = get_limiter(url)
+    if limiter:
+        await limiter.acquire_async()
+    async with get_async_session().get(url, **kwargs) as response:
+        if limiter:
+            limiter.feedback(response.status, response.headers.get('Retry-After'))
+        yield response
+
+
+async def close_async_session():
+    """Закрывает общую aiohttp-сессию."""
+    global _async_session
+    if _async_session is not None and not _async_session.closed:
+        await _async_session.close()
+    _async_session = None
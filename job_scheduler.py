@@ -0,0 +1,182 @@
+import asyncio
+import collections
+from servise import printer
+from settings import JOBS_MAX_CONCURRENT, JOBS_PER_USER, JOBS_MAX_QUEUED
+
+
+class SchedulerFull(Exception):
+    """Очередь заданий заполнена, новое задание не принято."""
+
+
+class _Job:
+    __slots__ = ('user_id', 'coro_factory', 'future', 'per_user', 'started')
+
+    def __init__(self, user_id, coro_factory, future, per_user):
+        self.user_id = user_id
+        self.coro_factory = coro_factory
+        self.future = future
+        self.per_user = per_user
+        self.started = False
+
+
+class JobScheduler:
+    """
+    Очередь заданий бота с общим лимитом и справедливым порядком между пользователями.
+
+    Одновременно выполняется не больше max_concurrent заданий и не больше per_user заданий
+    одного пользователя. Ожидающие задания хранятся в отдельной очереди на каждого пользователя,
+    и свободный слот получают пользователи по кругу (round-robin): 50 ссылок от одного пользователя
+    не задерживают остальных дольше, чем на одно его задание за круг.
+    Задания с priority=True (чат администратора) идут отдельной полосой впереди всех и не
+    ограничиваются per_user и max_queued.
+
+    Лимит на пользователя можно поднять для отдельного задания (run(..., per_user=N)): так ссылки
+    из одного сообщения-списка идут по несколько сразу, но по-прежнему в пределах max_concurrent
+    и по кругу с остальными пользователями.
+
+    Если ждут уже max_queued заданий, run() сразу бросает SchedulerFull.
+    """
+
+    def __init__(self, max_concurrent=JOBS_MAX_CONCURRENT, per_user=JOBS_PER_USER, max_queued=JOBS_MAX_QUEUED,
+                 name='job_scheduler'):
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_user = max(1, per_user)
+        self.max_queued = max_queued
+        self.name = name
+        self._priority = collections.deque()
+        self._queues = {}  # user_id -> deque ожидающих заданий
+        self._order = collections.deque()  # пользователи с ожидающими заданиями, в порядке обхода по кругу
+        self._running = collections.Counter()  # user_id -> выполняющихся заданий
+        self._running_total = 0
+        self._tasks = set()  # ссылки на запущенные задачи, чтобы их не удалил сборщик мусора
+
+    def queued(self):
+        """Сколько заданий ждут запуска (без полосы администратора)."""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def run(self, user_id, coro_factory, priority=False, on_queued=None, per_user=None):
+        """
+        Выполняет coro_factory() в порядке очереди и возвращает её результат.
+        Если задание не может стартовать сразу, вызывается await on_queued(position),
+        где position - номер в очереди, начиная с 1.
+        per_user - лимит одновременных заданий пользователя для этого задания вместо общего per_user.
+        """
+        if not priority and self.queued() >= self.max_queued:
+            raise SchedulerFull(f'в очереди уже {self.max_queued} заданий')
+
+        job = _Job(user_id, coro_factory, asyncio.get_running_loop().create_future(),
+                   max(1, per_user) if per_user else self.per_user)
+        if priority:
+            self._priority.append(job)
+        else:
+            if user_id not in self._queues:
+                self._queues[user_id] = collections.deque()
+                self._order.append(user_id)
+            self._queues[user_id].append(job)
+        self._dispatch()
+
+        try:
+            if not job.started:
+                position = self.position(job)
+                printer(f'[{self.name}] Задание пользователя {user_id} в очереди, позиция {position}', kind='info')
+                if on_queued is not None:
+                    try:
+                        await on_queued(position)
+                    except Exception as _ex:
+                        printer(f'[{self.name}] Не удалось сообщить позицию в очереди: {_ex}', kind='error')
+            # shield: отмена ожидающего не обрывает уже запущенное задание посередине
+            return await asyncio.shield(job.future)
+        except asyncio.CancelledError:
+            if not job.started:
+                self._remove(job)
+            else:
+                # задание доработает без ожидающего: забираем его исключение, иначе asyncio
+                # сообщит в лог «Future exception was never retrieved»
+                job.future.add_done_callback(lambda future: future.cancelled() or future.exception())
+            raise
+
+    def position(self, job):
+        """Номер ожидающего задания в очереди с учётом полосы администратора и обхода пользователей по кругу."""
+        if job in self._priority:
+            return self._priority.index(job) + 1
+        queue = self._queues.get(job.user_id)
+        if not queue or job not in queue:
+            return 0
+        rank = queue.index(job) + 1  # в каком круге обхода задание стартует
+        ahead = len(self._priority) + rank - 1
+        passed = False
+        for user_id in self._order:
+            if user_id == job.user_id:
+                passed = True
+                continue
+            # пользователи раньше по кругу успевают запустить rank заданий, после - rank - 1
+            ahead += min(len(self._queues[user_id]), rank if not passed else rank - 1)
+        return ahead + 1
+
+    def _remove(self, job):
+        if job in self._priority:
+            self._priority.remove(job)
+            return
+        queue = self._queues.get(job.user_id)
+        if queue and job in queue:
+            queue.remove(job)
+            if not queue:
+                self._drop_user(job.user_id)
+
+    def _drop_user(self, user_id):
+        del self._queues[user_id]
+        self._order.remove(user_id)
+
+    def _next_job(self):
+        if self._priority:
+            return self._priority.popleft()
+        for _ in range(len(self._order)):
+            user_id = self._order[0]
+            self._order.rotate(-1)
+            queue = self._queues[user_id]
+            if self._running[user_id] < queue[0].per_user:
+                job = queue.popleft()
+                if not queue:
+                    self._drop_user(user_id)
+                return job
+        return None
+
+    def _dispatch(self):
+        while self._running_total < self.max_concurrent:
+            job = self._next_job()
+            if job is None:
+                return
+            job.started = True
+            self._running[job.user_id] += 1
+            self._running_total += 1
+            task = asyncio.ensure_future(self._execute(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job):
+        try:
+            result = await job.coro_factory()
+        except asyncio.CancelledError:
+            job.future.cancel()
+            raise
+        except Exception as _ex:
+            if not job.future.done():
+                job.future.set_exception(_ex)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._running[job.user_id] -= 1
+            if not self._running[job.user_id]:
+                del self._running[job.user_id]
+            self._running_total -= 1
+            self._dispatch()
+
+    def stats(self):
+        """Выполняющиеся и ожидающие задания."""
+        return {
+            'running': self._running_total,
+            'queued': self.queued(),
+            'priority': len(self._priority),
+            'users_waiting': len(self._order),
+        }
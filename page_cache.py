@@ -0,0 +1,104 @@
+import json
+import os
+import threading
+import time
+from servise import printer, write_atomic
+from settings import downloads_dir_absolute, PAGE_CACHE_TTL
+
+# Кэш исходного HTML страниц объявлений.
+# Страница хранится рядом с остальными файлами объявления:
+#   downloads/<cian_number>/page.html       - HTML как его отдал Циан
+#   downloads/<cian_number>/page_meta.json  - URL, время загрузки, ETag и Last-Modified
+# Пока запись моложе PAGE_CACHE_TTL, страница берётся с диска без запроса к Циан.
+# После истечения TTL выполняется условный запрос (If-None-Match / If-Modified-Since):
+# ответ 304 продлевает запись, ответ 200 её перезаписывает; если Циан недоступен (ошибка сети, 429, 5xx),
+# отдаётся устаревшая запись.
+
+PAGE_FILE = 'page.html'
+META_FILE = 'page_meta.json'
+
+_stats = {'hit': 0, 'revalidated': 0, 'stale': 0, 'miss': 0}
+_stats_lock = threading.Lock()
+
+
+def _paths(cian_number):
+    directory = os.path.join(downloads_dir_absolute, str(cian_number))
+    return directory, os.path.join(directory, PAGE_FILE), os.path.join(directory, META_FILE)
+
+
+def load(cian_number):
+    """
+    Возвращает запись кэша {'html': ..., 'meta': {...}} или None, если страницы нет на диске.
+    """
+    _, page_path, meta_path = _paths(cian_number)
+    if not (os.path.exists(page_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, mode='r', encoding='utf8') as f:
+            meta = json.load(f)
+        with open(page_path, mode='r', encoding='utf8') as f:
+            html = f.read()
+        return {'html': html, 'meta': meta}
+    except (OSError, ValueError) as _ex:
+        printer(f'[page_cache] Не удалось прочитать кэш {cian_number}: {_ex}', kind='error')
+        return None
+
+
+def is_fresh(entry):
+    """Запись свежая, если с момента загрузки (или последней перепроверки) прошло меньше PAGE_CACHE_TTL секунд."""
+    return time.time() - entry['meta'].get('fetched_at', 0) < PAGE_CACHE_TTL
+
+
+def conditional_headers(entry):
+    """Заголовки условного запроса для перепроверки записи на сервере."""
+    result = {}
+    meta = entry['meta']
+    if meta.get('etag'):
+        result['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        result['If-Modified-Since'] = meta['last_modified']
+    return result
+
+
+def store(cian_number, url, html, response_headers):
+    """Сохраняет страницу и её валидаторы (ETag, Last-Modified) из заголовков ответа."""
+    directory, page_path, meta_path = _paths(cian_number)
+    meta = {
+        'url': url,
+        'fetched_at': time.time(),
+        'etag': response_headers.get('ETag'),
+        'last_modified': response_headers.get('Last-Modified'),
+    }
+    try:
+        os.makedirs(directory, exist_ok=True)
+        write_atomic(page_path, html)
+        write_atomic(meta_path, json.dumps(meta, ensure_ascii=False))
+    except OSError as _ex:
+        printer(f'[page_cache] Не удалось сохранить страницу {cian_number}: {_ex}', kind='error')
+
+
+def touch(cian_number, entry):
+    """Продлевает запись после ответа 304 Not Modified."""
+    _, _, meta_path = _paths(cian_number)
+    entry['meta']['fetched_at'] = time.time()
+    try:
+        write_atomic(meta_path, json.dumps(entry['meta'], ensure_ascii=False))
+    except OSError as _ex:
+        printer(f'[page_cache] Не удалось обновить метаданные {cian_number}: {_ex}', kind='error')
+
+
+def record(kind, cian_number):
+    """
+    Учитывает обращение к кэшу: 'hit' - свежая запись, 'revalidated' - сервер ответил 304,
+    'stale' - Циан недоступен и отдана устаревшая запись, 'miss' - страница загружена заново.
+    """
+    with _stats_lock:
+        _stats[kind] += 1
+        snapshot = dict(_stats)
+    printer(f'[page_cache] {kind} {cian_number} (всего: {snapshot})', kind='info')
+
+
+def stats():
+    """Текущие счётчики попаданий и промахов кэша."""
+    with _stats_lock:
+        return dict(_stats)
@@ -1,12 +1,18 @@
 import os
 import time
 from parser_cian.func import *
-import requests
-from bs4 import BeautifulSoup
+from parser_cian.dom_index import DomIndex
+from parser_cian.backend import make_soup
+from parser_cian.state import find_offer_state, extract_from_state, PARTIAL_FIELDS
 from servise import printer
-from settings import cookies, headers
-from create_cian import create_report_cian
-from PDF_creater import converter
+from http_client import fetch, fetch_async
+import page_cache
+import report_cache
+import telegram_files
+from settings import cookies, headers, downloads_dir_absolute, PAGE_CACHE_OFFLINE, PARTIAL_PARSE, FULL_PHOTO_SET, ARCHIVE_REPORTS
+from create_cian import create_report_cian, create_header_and_footer, render_report_cian, render_comparison_cian
+from PDF_creater import converter, archive_report, report_title, RenderedReport
+from pdf_service import pdf_service
 from dotenv import load_dotenv
 from icecream import ic
 import asyncio
@@ -16,54 +22,182 @@ from send_file import send_file_to_telegram
 load_dotenv()
 
 
-def main_parser(URL, cookies, headers):
-    printer(f'Обрабатываем страницу {URL}', kind='info')
-    cian_number = URL.rstrip('/').split('/')[-1]
-    # print(f"{cian_number=}")
-    # Отправляем GET-запрос к странице
+def dom_fields(result):
+    """
+    Поля, которые нужно извлечь get_* по разметке: их нет в результате из JSON-состояния
+    или состояние даёт их не полностью (PARTIAL_FIELDS).
+    """
+    return [field for field in EXTRACTORS if result.get(field) is None or field in PARTIAL_FIELDS]
+
+
+def parse_page(html):
+    """
+    Разбирает HTML страницы объявления и заполняет словарь результата.
+    Только CPU-работа, без сетевых запросов: фотографии скачиваются отдельно
+    по ссылкам из 'images_links' (в 'images' - только те, что попадают в отчёт).
+
+    Сначала данные берутся из JSON-состояния, встроенного в страницу (parser_cian.state).
+    Поля, которых в состоянии нет, извлекаются get_* по разметке (dom_fields()).
+    Обойти разбор DOM состояние не позволяет: 'params' оно даёт не полностью, а автора, брендинг,
+    застройщика, Росреестр и метаданные объявления (agent, author_branding, developer, rosreestr,
+    offer_metadata) не даёт вовсе, поэтому make_soup и DomIndex выполняются для каждой страницы.
+    Выигрыш в другом: при PARTIAL_PARSE разбираются только блоки этих полей, а не всей страницы
+    (замер: python benchmark.py state).
+    """
+    state = find_offer_state(html)
+    result = extract_from_state(state) if state else {}
+    missing = dom_fields(result)
+
+    if missing:
+        # Используем BeautifulSoup для парсинга HTML-кода страницы (построитель - HTML_PARSER из settings).
+        # При PARTIAL_PARSE в дерево попадают только блоки, которые читают get_* недостающих полей.
+        # DomIndex за один обход строит индексы data-name/data-testid/классов, и get_* находят свои блоки по ним
+        soup = DomIndex(make_soup(html, regions=regions_for(missing) if PARTIAL_PARSE else None))
+        dom_result = extract_listing(soup, fields=missing)
+        for field in missing:
+            if field in PARTIAL_FIELDS and result.get(field) and dom_result.get(field):
+                result[field] = {**dom_result[field], **result[field]}
+            elif result.get(field) is None:
+                result[field] = dom_result.get(field)
+
+    # Порядок ключей как у extract_listing(), чтобы JSON и сообщения не зависели от источника данных
+    return {field: result.get(field) for field in RESULT_FIELDS}
+
+
+def get_cian_number(URL):
+    """Номер объявления из ссылки вида https://www.cian.ru/sale/flat/<id>/."""
+    return URL.rstrip('/').split('/')[-1]
+
+
+def _cache_lookup(cian_number, headers):
+    """
+    Общая часть fetch_page() и fetch_page_async() до запроса к Циан.
+    Возвращает (entry, html, request_headers): entry - запись page_cache или None;
+    html - страница из кэша, если запрос не нужен; request_headers - заголовки запроса
+    с валидаторами entry, если запрос нужен. html и request_headers оба None - страницу не получить.
+    """
+    entry = page_cache.load(cian_number)
+    if entry and (PAGE_CACHE_OFFLINE or page_cache.is_fresh(entry)):
+        page_cache.record('hit', cian_number)
+        return entry, entry['html'], None
+    if PAGE_CACHE_OFFLINE:
+        printer(f'[parse_cian] Страницы {cian_number} нет в кэше, а режим PAGE_CACHE_OFFLINE включён', kind='error')
+        return entry, None, None
+
+    request_headers = dict(headers)
+    if entry:
+        request_headers.update(page_cache.conditional_headers(entry))
+    return entry, None, request_headers
+
+
+def _cache_response(URL, cian_number, entry, status_code, html, response_headers):
+    """
+    Общая часть fetch_page() и fetch_page_async() после запроса: ответ 304 продлевает запись entry,
+    ответ 200 сохраняется в page_cache. Если Циан недоступен (ошибка сети, 429 или 5xx), а устаревшая
+    запись есть, отдаётся она. Возвращает HTML страницы или None.
+    """
+    if status_code == 304 and entry:
+        page_cache.touch(cian_number, entry)
+        page_cache.record('revalidated', cian_number)
+        return entry['html']
+    if entry and (status_code is None or status_code == 429 or status_code >= 500):
+        printer(f"[parse_cian] {status_code=}, отдаём устаревшую страницу {cian_number} из кэша", kind='warning')
+        page_cache.record('stale', cian_number)
+        return entry['html']
+    if status_code != 200:
+        printer(f"[parse_cian] {status_code=}", kind='error')
+        return None
+
+    page_cache.store(cian_number, URL, html, response_headers)
+    page_cache.record('miss', cian_number)
+    return html
+
+
+def fetch_page(URL, cian_number, cookies, headers):
+    """
+    Возвращает HTML страницы объявления с учётом кэша page_cache:
+    свежая запись отдаётся с диска, устаревшая перепроверяется условным запросом.
+    Возвращает None, если страницу получить не удалось.
+    """
+    entry, html, request_headers = _cache_lookup(cian_number, headers)
+    if request_headers is None:
+        return html
+
+    status_code = response_headers = None
     try:
-        response = requests.get(URL, cookies=cookies, headers=headers)
+        response = fetch(URL, cookies=cookies, headers=request_headers)
+        status_code, html, response_headers = response.status_code, response.text, response.headers
+    except Exception as _ex:
+        printer(f'[parse_cian] {_ex} URL:{URL}', kind='error')
+    return _cache_response(URL, cian_number, entry, status_code, html, response_headers)
+
+
+async def fetch_page_async(URL, cian_number, cookies, headers):
+    """Асинхронный вариант fetch_page()."""
+    entry, html, request_headers = _cache_lookup(cian_number, headers)
+    if request_headers is None:
+        return html
 
-        status_code = response.status_code
+    status_code = response_headers = None
+    try:
+        async with fetch_async(URL, cookies=cookies, headers=request_headers) as response:
+            status_code = response.status
+            html = await response.text()
+            response_headers = response.headers
     except Exception as _ex:
         printer(f'[parse_cian] {_ex} URL:{URL}', kind='error')
+    return _cache_response(URL, cian_number, entry, status_code, html, response_headers)
 
-    if status_code == 200:
-        # Используем BeautifulSoup для парсинга HTML-кода страницы
-        soup = BeautifulSoup(response.text, "html.parser")
-        # with open(file='page.html', mode='w', encoding='utf8') as file:
-        #     file.write(str(soup))
-        # with open(file='page.html', mode='r', encoding='utf8') as file:
-        #     html = file.read()
-        # soup = BeautifulSoup(html, 'html.parser')
-
-        result = {
-            'title': get_title(soup),
-            'adress': get_adress(soup),
-            'price': get_price(soup),
-            'offer': get_offer(soup),
-            'metro': get_metro(soup),
-            # 'params':get_params(soup),
-            'params': get_all_offer_params(soup),
-            'author_branding': get_author_branding_info(soup), # Информация о брендинге автора
-            'offer_metadata': get_offer_metadata_info(soup), # Дата обновления и статистика просмотров
-            'developer': get_developer_info(soup),
-            'rosreestr': get_rosreestr_info(soup),
-            'agent': get_agent_info(soup),
-            'description': get_description(soup),
-            'images': get_imgages(soup, cian_number)[0],
-            'images_links': get_imgages(soup, cian_number)[1],
-        }
-
-    else:
-        printer(f"[parse_cian] {status_code=}", kind='error')
+
+def main_parser(URL, cookies, headers):
+    printer(f'Обрабатываем страницу {URL}', kind='info')
+    cian_number = get_cian_number(URL)
+    # print(f"{cian_number=}")
+    # Отправляем GET-запрос к странице (или берём её из кэша)
+    html = fetch_page(URL, cian_number, cookies, headers)
+    if html is None:
+        return None, cian_number
+
+    result = parse_page(html)
+    # Сразу качаем только фотографии, которые попадут в отчёт; остальные - ссылками или в фоне
+    eager, rest = report_links(result['images_links'])
+    result['images'] = download_images(eager, cian_number, purpose='pdf')
+    if FULL_PHOTO_SET:
+        download_images_background(rest, cian_number)
 
     printer(result, kind='info')
 
     return result, cian_number
 
+
+async def main_parser_async(URL, cookies, headers):
+    """
+    Асинхронный вариант main_parser() для бота.
+    Страница и фотографии скачиваются корутинами на event loop бота,
+    разбор HTML (CPU) выполняется в пуле потоков, чтобы не блокировать loop.
+    """
+    printer(f'Обрабатываем страницу {URL}', kind='info')
+    cian_number = get_cian_number(URL)
+    html = await fetch_page_async(URL, cian_number, cookies, headers)
+    if html is None:
+        return None, cian_number
+
+    loop = asyncio.get_running_loop()
+    result = await loop.run_in_executor(None, parse_page, html)
+    eager, rest = report_links(result['images_links'])
+    result['images'] = await download_images_async(eager, cian_number, purpose='pdf')
+    if FULL_PHOTO_SET:
+        download_images_background_async(rest, cian_number)
+
+    printer(result, kind='info')
+
+    return result, cian_number
+
+
 def parse_cian(URL, cookies, headers):
     result, cian_number = main_parser(URL, cookies, headers)
+    if not result:
+        return None, None
     page_index, header_index, footer_index = create_report_cian(result, cian_number)
     report = converter(
         page_index=page_index,
@@ -92,6 +226,102 @@ def parse_cian(URL, cookies, headers):
 
     return report, result
 
+
+def cached_report(key, name='kriss_real_estate_bot'):
+    """
+    Готовый отчёт без сборки: из report_cache, а если там его нет (например, после перезапуска бота),
+    но отчёт с этим ключом уже загружался в Telegram - RenderedReport без байтов PDF (pdf=None),
+    который бот отправит по file_id из telegram_files. None, если отчёт нужно собирать.
+    """
+    report = report_cache.get(key)
+    if report is None and telegram_files.get(key):
+        printer(f'[parse_cian] Отчёт {key[:12]} уже загружен в Telegram, сборка не нужна', kind='info')
+        report = RenderedReport(report_title(name), None, None, key)
+    return report
+
+
+async def parse_cian_async(URL, cookies, headers):
+    """
+    Асинхронный конвейер для бота: загрузка страницы и фотографий, отправка JSON в Telegram
+    выполняются на event loop; разбор HTML и сборка отчёта - в пуле потоков,
+    wkhtmltopdf - в очереди pdf_service.
+    HTML отчёта и PDF остаются в памяти, на диск (downloads/<cian_number>/) они пишутся только при ARCHIVE_REPORTS.
+    Повторный запрос того же объявления без изменений отдаётся из report_cache или, если PDF уже
+    загружался в Telegram, по file_id без сборки (см. cached_report()).
+    Возвращает (RenderedReport или None, словарь результата).
+    """
+    result, cian_number = await main_parser_async(URL, cookies, headers)
+    if not result:
+        return None, None
+
+    loop = asyncio.get_running_loop()
+    header_index, footer_index = create_header_and_footer()
+    # Тот же результат с тем же шаблоном и брендингом уже собирался - отправляем готовый PDF
+    key = report_cache.report_key(result, header_index)
+    report = cached_report(key)
+    if report is None:
+        html = await loop.run_in_executor(None, render_report_cian, result)
+        if html is not None:
+            # wkhtmltopdf - через общую очередь: одновременно собирается не больше PDF_WORKERS отчётов
+            pdf = await pdf_service.render(html, header_index, footer_index)
+            if pdf:
+                file_name = report_title()
+                path = archive_report(cian_number, html, pdf, file_name) if ARCHIVE_REPORTS else None
+                report = RenderedReport(file_name, pdf, path, key)
+                report_cache.put(key, report)
+
+    result['URL'] = URL
+    result['cian_number'] = cian_number
+
+    # JSON для администратора кладётся рядом с местом отчёта и удаляется после отправки
+    json_result = json_converter(
+        data_item=result,
+        report_path=report.path or os.path.join(downloads_dir_absolute, cian_number, report.file_name),
+    ) if report else None
+    try:
+        if not json_result or not os.path.exists(json_result):
+            printer(f"Error: File not found at {json_result}", kind='error')
+        else:
+            printer(f"[parse_cian] send JSON file: {json_result} with caption: '{URL}'", kind='info')
+            await send_file_to_telegram(json_result, URL)
+            os.remove(json_result)
+    except Exception as e:
+        printer(f"[parse_cian_async] Ошибка отправки JSON: {e}", kind='error')
+
+    return report, result
+
+async def compare_cian_async(URLs, cookies, headers):
+    """
+    Отчёт-сравнение нескольких объявлений одним PDF: страницы и фотографии загружаются параллельно,
+    HTML собирает render_comparison_cian(), PDF - один запуск wkhtmltopdf в очереди pdf_service.
+    Возвращает (RenderedReport или None, список результатов объявлений, которые удалось разобрать).
+    """
+    gathered = await asyncio.gather(*(main_parser_async(URL, cookies, headers) for URL in URLs))
+    parsed = [(URL, result, cian_number) for URL, (result, cian_number) in zip(URLs, gathered) if result]
+    results = [result for _, result, _ in parsed]
+    if len(results) < 2:
+        return None, results
+
+    loop = asyncio.get_running_loop()
+    header_index, footer_index = create_header_and_footer()
+    key = report_cache.report_key(results, header_index)
+    report = cached_report(key, 'kriss_real_estate_bot_compare')
+    if report is None:
+        html = await loop.run_in_executor(None, render_comparison_cian, results)
+        if html is not None:
+            pdf = await pdf_service.render(html, header_index, footer_index)
+            if pdf:
+                file_name = report_title('kriss_real_estate_bot_compare')
+                archive_name = 'compare_' + '_'.join(cian_number for _, _, cian_number in parsed)
+                path = archive_report(archive_name, html, pdf, file_name) if ARCHIVE_REPORTS else None
+                report = RenderedReport(file_name, pdf, path, key)
+                report_cache.put(key, report)
+
+    for URL, result, cian_number in parsed:
+        result['URL'] = URL
+        result['cian_number'] = cian_number
+    return report, results
+
 if __name__ == '__main__':
     URLs = [
         # 'https://www.cian.ru/sale/flat/312256069/', # Продается 3-комн. квартира, 86,2 м² в ЖК «Новые Смыслы»
@@ -0,0 +1,56 @@
+from bs4 import BeautifulSoup, FeatureNotFound, SoupStrainer
+from servise import printer
+from settings import HTML_PARSER
+
+# Встроенный построитель, который есть всегда; на него переходим, если выбранный не установлен
+FALLBACK_PARSER = 'html.parser'
+
+# Построители, которые уже не удалось подключить (чтобы не предупреждать на каждой странице)
+_unavailable = set()
+
+
+class RegionStrainer(SoupStrainer):
+    """
+    Пропускает в дерево только блоки-регионы и их содержимое.
+
+    regions - набор (тег, атрибут, значение), например ('div', 'data-name', 'OfferTitleNew')
+    (см. EXTRACTOR_REGIONS в parser_cian.func). Узел верхнего уровня создаётся, только если
+    совпадает с одним из регионов; всё внутри совпавшего блока строится целиком,
+    поэтому get_* ищут внутри блока так же, как в полном дереве.
+    """
+
+    def __init__(self, regions):
+        super().__init__()
+        self.regions = frozenset(regions)
+        self.attrs_by_tag = {}
+        for tag, attr, _ in self.regions:
+            self.attrs_by_tag.setdefault(tag, set()).add(attr)
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        attrs = attrs or {}
+        return any((name, attr, attrs.get(attr)) in self.regions for attr in self.attrs_by_tag.get(name, ()))
+
+
+def make_soup(html, parser=None, regions=None, **kwargs):
+    """
+    Строит дерево BeautifulSoup выбранным построителем (HTML_PARSER из settings или parser).
+
+    Все get_* работают с API BeautifulSoup, поэтому смена построителя их не затрагивает:
+    'lxml' разбирает страницу Циан в несколько раз быстрее встроенного 'html.parser'.
+    Если библиотека построителя не установлена, используется 'html.parser'.
+
+    regions - если задан, в дерево попадают только эти блоки страницы (RegionStrainer):
+    остальная разметка токенизируется, но объекты для неё не создаются.
+    'html5lib' частичный разбор не поддерживает и строит дерево целиком.
+    """
+    parser = parser or HTML_PARSER
+    if regions:
+        kwargs['parse_only'] = RegionStrainer(regions)
+    if parser not in _unavailable:
+        try:
+            return BeautifulSoup(html, parser, **kwargs)
+        except FeatureNotFound:
+            _unavailable.add(parser)
+            printer(f"[backend] Построитель '{parser}' не установлен, используется '{FALLBACK_PARSER}'",
+                    kind='warning')
+    return BeautifulSoup(html, FALLBACK_PARSER, **kwargs)
@@ -0,0 +1,94 @@
+from collections import defaultdict
+from bs4 import Tag
+
+# Атрибуты, по которым строятся индексы. Все extractors (get_*) находят свои блоки по ним.
+INDEXED_ATTRS = ('data-name', 'data-testid', 'data-id')
+
+
+class DomIndex:
+    """
+    Индекс документа BeautifulSoup, построенный за один обход дерева.
+
+    Каждый soup.find('div', {'data-name': 'OfferTitleNew'}) в get_* проходит весь документ заново,
+    а на странице Циан это десятки тысяч узлов. DomIndex один раз собирает словари
+    data-name / data-testid / data-id / класс / имя тега -> список узлов (в порядке документа),
+    после чего поиск блока сводится к выборке из словаря.
+
+    Объект повторяет интерфейс soup.find()/find_all() для вызовов, которые делают get_*,
+    поэтому его можно передавать в них вместо soup. Поиск по условиям, которые индекс
+    не поддерживает (функции, recursive, string и т.п.), выполняется обычным soup.find().
+    Найденные узлы - обычные Tag, поэтому поиск внутри блока работает как раньше.
+    """
+
+    def __init__(self, soup):
+        self.soup = soup
+        self.by_attr = {attr: defaultdict(list) for attr in INDEXED_ATTRS}
+        self.by_class = defaultdict(list)
+        self.by_tag = defaultdict(list)
+
+        for node in soup.descendants:
+            if not isinstance(node, Tag):
+                continue
+            self.by_tag[node.name].append(node)
+            attrs = node.attrs
+            for attr in INDEXED_ATTRS:
+                value = attrs.get(attr)
+                if value is not None:
+                    self.by_attr[attr][value].append(node)
+            for class_name in attrs.get('class', ()):
+                self.by_class[class_name].append(node)
+
+    def _candidates(self, name, attrs, kwargs):
+        """
+        Возвращает список узлов-кандидатов из самого узкого подходящего индекса
+        или None, если условия поиска индексом не поддерживаются.
+        """
+        if name is not None and not isinstance(name, str):
+            return None
+        attrs = dict(attrs or {})
+        if 'class_' in kwargs:
+            attrs['class'] = kwargs['class_']
+        if set(kwargs) - {'class_'}:
+            return None
+
+        candidates = None
+        for key, value in attrs.items():
+            if not isinstance(value, str) or (key == 'class' and ' ' in value):
+                return None
+            if key in self.by_attr:
+                found = self.by_attr[key].get(value, [])
+            elif key == 'class':
+                found = self.by_class.get(value, [])
+            else:
+                return None
+            if candidates is None or len(found) < len(candidates):
+                candidates = found
+        if candidates is None:
+            if name is None:
+                return None
+            candidates = self.by_tag.get(name, [])
+        return [node for node in candidates if self._matches(node, name, attrs)]
+
+    @staticmethod
+    def _matches(node, name, attrs):
+        if name is not None and node.name != name:
+            return False
+        for key, value in attrs.items():
+            if key == 'class':
+                if value not in node.get('class', ()):
+                    return False
+            elif node.get(key) != value:
+                return False
+        return True
+
+    def find_all(self, name=None, attrs=None, **kwargs):
+        found = self._candidates(name, attrs, kwargs)
+        if found is None:
+            return self.soup.find_all(name, attrs or {}, **kwargs)
+        return found
+
+    def find(self, name=None, attrs=None, **kwargs):
+        found = self._candidates(name, attrs, kwargs)
+        if found is None:
+            return self.soup.find(name, attrs or {}, **kwargs)
+        return found[0] if found else None
@@ -4,6 +4,15 @@ import requests
 from icecream import ic
 from settings import downloads_dir_absolute
 from servise import printer
+from parser_cian.images import (
+    save_image,
+    download_images,
+    save_image_async,
+    download_images_async,
+    report_links,
+    download_images_background,
+    download_images_background_async,
+)
 import re
 from datetime import datetime, timedelta
 
@@ -823,78 +832,85 @@ def get_description(soup):
         return None
 
 
-def save_image(image_directory, img_url, number):
-    img_url_modified = img_url.replace('-2.jpg', '-1.jpg')  # Модифицируем URL один раз
-
+def get_image_links(soup):
+    """
+    Возвращает ссылки на фотографии объявления (миниатюры ThumbComponent) в порядке их следования на странице.
+    """
+    images = []
     try:
-        # Формируем имя файла и полный путь для сохранения
-        # Используем модифицированный URL для имени файла
-        file_name = os.path.split(img_url_modified)[1]
-        path_to_save = os.path.join(image_directory, file_name)
-
-        # Проверяем, существует ли файл по этому пути
-        if os.path.exists(path_to_save):
-            printer(f"Изображение '{file_name}' уже существует. Пропуск загрузки.", kind='info')
-            return path_to_save  # Возвращаем путь к уже существующему файлу
-
-        # Если файла нет, продолжаем с загрузкой
-        t = 0.9
-        if number % 2 == 0:
-            t += 0.4
-
-        # printer(f"Пауза перед загрузкой {img_url_modified}: {t:.1f} сек.", kind='info')  # Отладочное сообщение
-        time.sleep(t)
-
-        # printer(f"Загрузка изображения: {img_url_modified}", kind='info')  # Отладочное сообщение
-        response = requests.get(img_url_modified, timeout=15)  # Добавлен таймаут для запроса
-        response.raise_for_status()  # Проверка на HTTP ошибки (4xx, 5xx)
-
-        # Убедимся, что директория существует перед сохранением
-        os.makedirs(image_directory, exist_ok=True)
-
-        with open(path_to_save, 'wb') as img_file:
-            img_file.write(response.content)
-        printer(f"Изображение сохранено как '{file_name}'", kind='info')
-
-    except requests.exceptions.HTTPError as http_err:
-        printer(f'HTTP ошибка при загрузке {img_url_modified}: {http_err}', kind='error')
-        return None  # или path_to_save, если нужно знать, какой файл не удалось скачать
-    except requests.exceptions.ConnectionError as conn_err:
-        printer(f'Ошибка соединения при загрузке {img_url_modified}: {conn_err}', kind='error')
-        return None
-    except requests.exceptions.Timeout as timeout_err:
-        printer(f'Таймаут при загрузке {img_url_modified}: {timeout_err}', kind='error')
-        return None
-    except requests.exceptions.RequestException as req_err:  # Общее исключение для requests
-        printer(f'Ошибка requests при загрузке {img_url_modified}: {req_err}', kind='error')
-        return None
-    except IOError as io_err:  # Ошибки при работе с файлами
-        printer(f'Ошибка ввода-вывода при сохранении {path_to_save}: {io_err}', kind='error')
-        return None
+        for item in soup.find_all('img'):
+            if 'data-name="ThumbComponent"' in str(item):
+                images.append(str(item).split('src=')[1][1:-3])
     except Exception as _ex:
-        printer(f'Непредвиденная ошибка при обработке {img_url_modified}: {_ex}', kind='error')
-        return None  # Возвращаем None в случае любой другой ошибки, чтобы сигнализировать о неудаче
-
-    return path_to_save
+        printer(f'error_get_image_links: {_ex}', kind='error')
+    return images
 
 
 def get_imgages(soup, cian_number):
-    # Создадим директорию для сохранения изображений
-    image_directory = os.path.join(downloads_dir_absolute, cian_number)
-    # ic(image_directory)
-    os.makedirs(image_directory, exist_ok=True)
-    img_list = []
-
-    try:
-        images = []
-        image_tags = soup.find_all('img')
-        for num, item in enumerate(image_tags):
-            if 'data-name="ThumbComponent"' in str(item):
-                image = str(item).split('src=')[1][1:-3]
-                images.append((image))
-                img_list.append(save_image(image_directory, image, num))
-        printer(f'{img_list=}', )
-    except Exception as _ex:
-        printer(f'error_get_imgages: {_ex}', kind='error')
-
-    return [img_list, images]
+    """[пути к фотографиям для отчёта, все ссылки на фотографии]. Остальные фотографии не скачиваются."""
+    images = get_image_links(soup)
+    return [download_images(report_links(images)[0], cian_number, purpose='pdf'), images]
+
+
+# Поле результата -> функция, извлекающая его из документа.
+# Порядок совпадает с порядком ключей в итоговом словаре.
+EXTRACTORS = {
+    'title': get_title,
+    'adress': get_adress,
+    'price': get_price,
+    'offer': get_offer,
+    'metro': get_metro,
+    # 'params':get_params,
+    'params': get_all_offer_params,
+    'author_branding': get_author_branding_info,  # Информация о брендинге автора
+    'offer_metadata': get_offer_metadata_info,  # Дата обновления и статистика просмотров
+    'developer': get_developer_info,
+    'rosreestr': get_rosreestr_info,
+    'agent': get_agent_info,
+    'description': get_description,
+    'images_links': get_image_links,
+}
+
+
+# Поле результата -> блоки страницы, которые читает его функция из EXTRACTORS: (тег, атрибут, значение).
+# По этому списку make_soup(regions=...) строит дерево только из нужных поддеревьев (см. PARTIAL_PARSE).
+# Если get_* начинает читать новый блок, его нужно добавить сюда, иначе в частичном дереве его не будет.
+EXTRACTOR_REGIONS = {
+    'title': (('div', 'data-name', 'OfferTitleNew'),),
+    'adress': (('div', 'data-name', 'AddressContainer'),),
+    'price': (('div', 'data-testid', 'price-amount'),),
+    'offer': (('div', 'data-name', 'OfferFactsInSidebar'),),
+    'metro': (('ul', 'data-name', 'UndergroundList'),),
+    'params': (('div', 'data-name', 'ObjectFactoids'), ('div', 'data-name', 'OfferSummaryInfoLayout')),
+    'author_branding': (('div', 'data-name', 'AuthorBrandingAside'),),
+    'offer_metadata': (('div', 'data-name', 'OfferMetaData'),),
+    'developer': (('ul', 'data-name', 'NewbuildingSpecifications'), ('div', 'data-name', 'DeveloperLayout')),
+    'rosreestr': (('div', 'data-name', 'RosreestrSection'),),
+    'agent': (('div', 'data-name', 'AgentInfo'),),
+    'description': (('div', 'data-id', 'content'),),
+    'images_links': (('img', 'data-name', 'ThumbComponent'),),
+}
+
+
+def regions_for(fields=None):
+    """Блоки страницы, нужные для извлечения полей fields (по умолчанию всех полей EXTRACTORS)."""
+    return {region for field in (fields or EXTRACTORS) for region in EXTRACTOR_REGIONS[field]}
+
+
+# Ключи итогового словаря: поля EXTRACTORS и 'images' (локальные пути фотографий) после описания
+RESULT_FIELDS = tuple(EXTRACTORS)[:tuple(EXTRACTORS).index('description') + 1] + ('images', 'images_links')
+
+
+def extract_listing(soup, fields=None):
+    """
+    Запускает get_* над документом и собирает словарь результата.
+    soup - BeautifulSoup или DomIndex поверх него. fields - какие поля извлекать (по умолчанию все).
+    Фотографии здесь не скачиваются: 'images' заполняется позже по ссылкам из 'images_links'.
+    """
+    result = {}
+    for field in RESULT_FIELDS:
+        if field in EXTRACTORS and (fields is None or field in fields):
+            result[field] = EXTRACTORS[field](soup)
+        elif field == 'images':
+            result['images'] = None
+    return result
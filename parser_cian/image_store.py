@@ -0,0 +1,59 @@
+import os
+import shutil
+import threading
+from servise import printer
+from settings import IMAGE_STORE_DIR
+
+# Общее хранилище фотографий для всех объявлений: downloads/_store/<имя файла на CDN>.
+# Имя файла на images.cdn-cian.ru - это id изображения (2451958729-1.jpg), поэтому оно и служит ключом:
+# рендеры и планировки ЖК, которые повторяются в разных объявлениях, хранятся и скачиваются один раз.
+# В каталог объявления downloads/<cian_number>/ кладётся жёсткая ссылка на файл хранилища
+# (или копия, если файловая система жёсткие ссылки не поддерживает).
+
+os.makedirs(IMAGE_STORE_DIR, exist_ok=True)
+
+_counters = {'hit': 0, 'miss': 0}
+_counters_lock = threading.Lock()
+
+
+def store_path(file_name):
+    """Путь к изображению file_name в хранилище (файла может ещё не быть)."""
+    return os.path.join(IMAGE_STORE_DIR, file_name)
+
+
+def lookup(file_name):
+    """Путь к изображению в хранилище или None, если оно ещё не скачивалось."""
+    path = store_path(file_name)
+    return path if os.path.exists(path) else None
+
+
+def link_into(file_name, directory):
+    """
+    Делает изображение из хранилища доступным в каталоге объявления и возвращает путь к нему там.
+    Существующий файл в каталоге не перезаписывается.
+    """
+    source = store_path(file_name)
+    target = os.path.join(directory, file_name)
+    if os.path.exists(target):
+        return target
+    os.makedirs(directory, exist_ok=True)
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        pass
+    except OSError as _ex:
+        printer(f'[image_store] Жёсткая ссылка {file_name} не создана ({_ex}), копируем файл', kind='info')
+        shutil.copy2(source, target)
+    return target
+
+
+def record(kind):
+    """Учитывает попадание ('hit') или промах ('miss') хранилища."""
+    with _counters_lock:
+        _counters[kind] += 1
+
+
+def stats():
+    """Счётчики хранилища с запуска процесса: {'hit': ..., 'miss': ...}."""
+    with _counters_lock:
+        return dict(_counters)
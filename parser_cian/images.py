@@ -0,0 +1,280 @@
+import os
+import re
+import time
+import uuid
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import aiofiles
+import aiohttp
+import requests
+from settings import downloads_dir_absolute, IMAGE_CONCURRENCY, IMAGE_CHUNK_SIZE, REPORT_IMAGES
+from servise import printer
+from http_client import fetch, fetch_async
+from parser_cian import image_store
+from parser_cian.thumbnails import TARGET_WIDTH
+
+# Этап загрузки фотографий объявления.
+# Фотографии качаются параллельно, но не более IMAGE_CONCURRENCY одновременно (бюджет на CDN Циан);
+# темп запросов дополнительно ограничивает лимитер хоста images.cdn-cian.ru в http_client.
+# Тело ответа пишется на диск по частям во временный файл <имя>.part и переименовывается
+# после успешной загрузки, поэтому оборванная загрузка не оставляет битый файл под настоящим именем.
+# Файлы скачиваются в общее хранилище image_store и попадают в каталог объявления жёсткой ссылкой:
+# фотография, уже скачанная для любого объявления, повторно не скачивается.
+#
+# В асинхронном режиме сеть идёт корутинами, тело ответа пишется через aiofiles, а переименование,
+# удаление и связывание файлов (блокирующие вызовы ОС) уходят в пул потоков event loop.
+#
+# Сразу качаются только фотографии, которые попадают в отчёт (первые REPORT_IMAGES ссылок),
+# остальные остаются ссылками в 'images_links' или догружаются в фоне (FULL_PHOTO_SET).
+
+# Варианты фотографии на images.cdn-cian.ru (суффикс имени файла: 2451958729-2.jpg) и их примерная ширина
+# в пикселях, от меньшего к большему. Раньше всегда качался самый большой вариант -1.
+CDN_VARIANTS = (('4', 320), ('2', 640), ('1', 1600))
+_VARIANT_RE = re.compile(r'-(\d)\.(jpg|jpeg|png|webp)$')
+
+# Сколько пикселей по ширине нужно каждому потребителю фотографий; None - самый большой вариант.
+#   pdf - фотографии в отчёте (с учётом REPORT_IMAGE_DPI), archive - полный набор фотографий объявления.
+IMAGE_PURPOSES = {
+    'pdf': TARGET_WIDTH,
+    'archive': None,
+}
+
+# Фоновые загрузки полного набора фотографий: пул для синхронного режима и задачи event loop
+# (ссылки на задачи держим, иначе сборщик мусора может удалить незавершённую задачу)
+_background_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='images-background')
+_background_tasks = set()
+
+
+def variant_urls(img_url, purpose='archive'):
+    """
+    Ссылки на варианты фотографии для потребителя purpose (см. IMAGE_PURPOSES): сначала самый маленький
+    вариант, которого хватает по ширине, затем варианты крупнее - запасные, если нужного нет на CDN.
+    Ссылки не с CDN Циан возвращаются как есть.
+    """
+    match = _VARIANT_RE.search(img_url)
+    if not match:
+        return [img_url]
+    need = IMAGE_PURPOSES[purpose]
+    first = next((i for i, (_, width) in enumerate(CDN_VARIANTS) if need is not None and width >= need),
+                 len(CDN_VARIANTS) - 1)
+    return [f'{img_url[:match.start()]}-{suffix}.{match.group(2)}' for suffix, _ in CDN_VARIANTS[first:]]
+
+
+def _from_store(image_directory, candidates):
+    """Запись _record() для первого из вариантов, который уже есть в хранилище, или None."""
+    for url in candidates:
+        file_name = os.path.basename(url)
+        if image_store.lookup(file_name) is not None:
+            image_store.record('hit')
+            return _record(url, image_store.link_into(file_name, image_directory), cached=True)
+    return None
+
+
+def _record(img_url, path=None, started=None, error=None, cached=False):
+    """Итог загрузки одной фотографии: путь (None при ошибке), время в секундах и текст ошибки."""
+    return {
+        'url': img_url,
+        'path': path,
+        'seconds': time.perf_counter() - started if started is not None else 0.0,
+        'error': error,
+        'cached': cached,
+    }
+
+
+def _part_path(file_name):
+    """Временный файл загрузки в хранилище. У каждой загрузки свой: одну фотографию могут качать два объявления сразу."""
+    return f'{image_store.store_path(file_name)}.{uuid.uuid4().hex}.part'
+
+
+def _download(url):
+    """
+    Скачивает url в хранилище. Возвращает (None, False) при успехе или (текст ошибки, стоит ли пробовать
+    вариант крупнее): крупнее пробуем, только если сервер ответил ошибкой HTTP (варианта нет).
+    """
+    file_name = os.path.basename(url)
+    part_path = _part_path(file_name)
+    try:
+        with fetch(url, stream=True) as response:
+            response.raise_for_status()
+            with open(part_path, 'wb') as img_file:
+                for chunk in response.iter_content(chunk_size=IMAGE_CHUNK_SIZE):
+                    img_file.write(chunk)
+        os.replace(part_path, image_store.store_path(file_name))
+    except requests.exceptions.HTTPError as http_err:
+        return f'HTTP ошибка: {http_err}', True
+    except requests.exceptions.ConnectionError as conn_err:
+        return f'Ошибка соединения: {conn_err}', False
+    except requests.exceptions.Timeout as timeout_err:
+        return f'Таймаут: {timeout_err}', False
+    except requests.exceptions.RequestException as req_err:
+        return f'Ошибка requests: {req_err}', False
+    except IOError as io_err:
+        return f'Ошибка ввода-вывода: {io_err}', False
+    except Exception as _ex:
+        return f'Непредвиденная ошибка: {_ex}', False
+    finally:
+        _remove_part(part_path)
+    return None, False
+
+
+def _remove_part(part_path):
+    """Удаляет временный файл неудачной загрузки (после успешной он уже переименован)."""
+    if os.path.exists(part_path):
+        os.remove(part_path)
+
+
+async def _download_async(url):
+    """
+    Асинхронный вариант _download() через общую aiohttp-сессию: файл пишется через aiofiles,
+    переименование и удаление временного файла выполняются в пуле потоков.
+    """
+    loop = asyncio.get_running_loop()
+    file_name = os.path.basename(url)
+    part_path = _part_path(file_name)
+    try:
+        async with fetch_async(url) as response:
+            response.raise_for_status()
+            async with aiofiles.open(part_path, 'wb') as img_file:
+                async for chunk in response.content.iter_chunked(IMAGE_CHUNK_SIZE):
+                    await img_file.write(chunk)
+        await loop.run_in_executor(None, os.replace, part_path, image_store.store_path(file_name))
+    except aiohttp.ClientResponseError as http_err:
+        return f'HTTP ошибка: {http_err}', True
+    except asyncio.TimeoutError as timeout_err:
+        return f'Таймаут: {timeout_err!r}', False
+    except aiohttp.ClientError as client_err:
+        return f'Ошибка соединения: {client_err}', False
+    except IOError as io_err:
+        return f'Ошибка ввода-вывода: {io_err}', False
+    except Exception as _ex:
+        return f'Непредвиденная ошибка: {_ex}', False
+    finally:
+        await loop.run_in_executor(None, _remove_part, part_path)
+    return None, False
+
+
+def _finish(image_directory, url, started):
+    image_store.record('miss')
+    return _record(url, image_store.link_into(os.path.basename(url), image_directory), started=started)
+
+
+def save_image(image_directory, img_url, purpose='archive'):
+    """
+    Скачивает подходящий для purpose вариант фотографии в хранилище (если его там ещё нет)
+    и связывает его с image_directory.
+    Возвращает запись _record(): путь к файлу (или None при ошибке), время загрузки, ошибку.
+    """
+    candidates = variant_urls(img_url, purpose)
+    found = _from_store(image_directory, candidates)
+    if found:
+        return found
+
+    started = time.perf_counter()
+    for url in candidates:
+        error, try_larger = _download(url)
+        if error is None:
+            return _finish(image_directory, url, started)
+        if not try_larger or url == candidates[-1]:
+            return _record(url, started=started, error=error)
+        printer(f'[images] {os.path.basename(url)}: {error}, пробуем вариант крупнее', kind='info')
+
+
+async def save_image_async(image_directory, img_url, purpose='archive'):
+    """Асинхронный вариант save_image(): поиск в хранилище и связывание файлов - в пуле потоков."""
+    loop = asyncio.get_running_loop()
+    candidates = variant_urls(img_url, purpose)
+    found = await loop.run_in_executor(None, _from_store, image_directory, candidates)
+    if found:
+        return found
+
+    started = time.perf_counter()
+    for url in candidates:
+        error, try_larger = await _download_async(url)
+        if error is None:
+            return await loop.run_in_executor(None, _finish, image_directory, url, started)
+        if not try_larger or url == candidates[-1]:
+            return _record(url, started=started, error=error)
+        printer(f'[images] {os.path.basename(url)}: {error}, пробуем вариант крупнее', kind='info')
+
+
+def report(records, cian_number, elapsed):
+    """Пишет в лог время каждой фотографии, ошибки и итог этапа."""
+    for item in records:
+        if item['error']:
+            printer(f"[images] {cian_number}: {item['url']} - {item['error']} ({item['seconds']:.2f} сек.)",
+                    kind='error')
+        elif item['cached']:
+            printer(f"[images] {cian_number}: {os.path.basename(item['path'])} уже на диске", kind='info')
+        else:
+            printer(f"[images] {cian_number}: {os.path.basename(item['path'])} за {item['seconds']:.2f} сек.",
+                    kind='info')
+    failed = sum(1 for item in records if item['error'])
+    printer(f'[images] {cian_number}: {len(records) - failed} из {len(records)} фотографий за {elapsed:.2f} сек. '
+            f'(параллельно до {IMAGE_CONCURRENCY})', kind='warning' if failed else 'info')
+
+
+def download_images(images, cian_number, purpose='archive'):
+    """
+    Скачивает фотографии по списку ссылок (см. get_image_links) в downloads/<cian_number>/,
+    не более IMAGE_CONCURRENCY одновременно (пул потоков). purpose - для чего нужны фотографии
+    (IMAGE_PURPOSES), от него зависит, какой вариант с CDN скачивается.
+    Возвращает список локальных путей в том же порядке, что и ссылки (None для неудачных загрузок).
+    """
+    images = images or []
+    image_directory = os.path.join(downloads_dir_absolute, cian_number)
+    os.makedirs(image_directory, exist_ok=True)
+    if not images:
+        return []
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(IMAGE_CONCURRENCY, len(images)),
+                            thread_name_prefix='images') as pool:
+        records = list(pool.map(lambda url: save_image(image_directory, url, purpose), images))
+    report(records, cian_number, time.perf_counter() - started)
+    return [item['path'] for item in records]
+
+
+async def download_images_async(images, cian_number, purpose='archive'):
+    """
+    Асинхронный вариант download_images(): не более IMAGE_CONCURRENCY загрузок одновременно (семафор).
+    Возвращает список локальных путей в том же порядке, что и ссылки.
+    """
+    images = images or []
+    image_directory = os.path.join(downloads_dir_absolute, cian_number)
+    await asyncio.get_running_loop().run_in_executor(
+        None, lambda: os.makedirs(image_directory, exist_ok=True))
+    if not images:
+        return []
+
+    semaphore = asyncio.Semaphore(IMAGE_CONCURRENCY)
+
+    async def bounded(url):
+        async with semaphore:
+            return await save_image_async(image_directory, url, purpose)
+
+    started = time.perf_counter()
+    records = await asyncio.gather(*(bounded(url) for url in images))
+    report(records, cian_number, time.perf_counter() - started)
+    return [item['path'] for item in records]
+
+
+def report_links(images):
+    """Делит ссылки на фотографии для отчёта (качаются сразу) и остальные."""
+    images = images or []
+    return images[:REPORT_IMAGES], images[REPORT_IMAGES:]
+
+
+def download_images_background(images, cian_number):
+    """Ставит загрузку фотографий в фоновый поток и сразу возвращает управление."""
+    if images:
+        printer(f'[images] {cian_number}: {len(images)} фотографий поставлено в фоновую загрузку', kind='info')
+        _background_pool.submit(download_images, images, cian_number)
+
+
+def download_images_background_async(images, cian_number):
+    """Запускает download_images_async() отдельной задачей event loop, не дожидаясь её завершения."""
+    if images:
+        printer(f'[images] {cian_number}: {len(images)} фотографий поставлено в фоновую загрузку', kind='info')
+        task = asyncio.ensure_future(download_images_async(images, cian_number))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
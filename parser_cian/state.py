@@ -0,0 +1,191 @@
+import json
+import re
+from servise import printer
+
+# Циан отдаёт данные объявления не только разметкой, но и JSON-состоянием фронтенда:
+#   window._cianConfig['frontend-offer-card'] = (window._cianConfig['frontend-offer-card'] || []).concat([...]);
+# В массиве есть элемент {"key": "defaultState", "value": {...}}, где value['offerData']['offer'] -
+# то же объявление, которое рендерится на странице. Разобрать этот JSON на порядок быстрее, чем
+# строить дерево BeautifulSoup, и он не зависит от хэшированных классов вида a10a3f92e9--item--E1gcC.
+
+_STATE_RE = re.compile(r"_cianConfig\['frontend-offer-card'\][^;]*?\.concat\(")
+_decoder = json.JSONDecoder()
+
+# Поля, которые состояние заполняет лишь частично: значения из состояния дополняются
+# данными из разметки (у разметки больше параметров, состояние - надёжнее по основным).
+PARTIAL_FIELDS = ('params',)
+
+SALE_TYPES = {
+    'free': 'свободная продажа',
+    'alternative': 'альтернатива',
+    'dupt': 'переуступка',
+    'dup': 'договор уступки права требования',
+    'fz214': 'долевое участие (214-ФЗ)',
+    'pdkp': 'предварительный договор купли-продажи',
+}
+REPAIR_TYPES = {
+    'no': 'Без ремонта',
+    'cosmetic': 'Косметический',
+    'euro': 'Евроремонт',
+    'design': 'Дизайнерский',
+}
+WINDOWS_VIEW_TYPES = {
+    'street': 'На улицу',
+    'yard': 'Во двор',
+    'yardAndStreet': 'На улицу и двор',
+}
+MATERIAL_TYPES = {
+    'brick': 'Кирпичный',
+    'monolith': 'Монолитный',
+    'monolithBrick': 'Монолитно-кирпичный',
+    'panel': 'Панельный',
+    'block': 'Блочный',
+    'wood': 'Деревянный',
+    'stalin': 'Сталинский',
+    'old': 'Старый фонд',
+}
+PARKING_TYPES = {
+    'ground': 'Наземная',
+    'underground': 'Подземная',
+    'multilevel': 'Многоуровневая',
+    'open': 'Открытая',
+}
+
+
+def find_offer_state(html):
+    """
+    Находит в HTML JSON-состояние карточки объявления и возвращает value элемента 'defaultState'.
+    Возвращает None, если состояние не найдено или не разбирается.
+    """
+    match = _STATE_RE.search(html)
+    if not match:
+        return None
+    try:
+        items, _ = _decoder.raw_decode(html, match.end())
+    except ValueError as _ex:
+        printer(f'[state] Не удалось декодировать состояние страницы: {_ex}', kind='warning')
+        return None
+    for item in items if isinstance(items, list) else []:
+        if isinstance(item, dict) and item.get('key') == 'defaultState':
+            return item.get('value')
+    return None
+
+
+def _number(value):
+    """54.6 / '54.60' / 55.0 -> '54,6' / '54,6' / '55' - как число выглядит на странице."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    text = f'{number:.2f}'.rstrip('0').rstrip('.')
+    return text.replace('.', ',')
+
+
+def _plural(count, one, few, many):
+    if count % 10 == 1 and count % 100 != 11:
+        return one
+    if 2 <= count % 10 <= 4 and not 12 <= count % 100 <= 14:
+        return few
+    return many
+
+
+def _counted(parts):
+    """[(2, ('совмещенный', 'совмещенных', 'совмещенных')), ...] -> '2 совмещенных, ...' без нулевых."""
+    result = [f'{count} {_plural(count, *forms)}' for count, forms in parts if count]
+    return ', '.join(result) or None
+
+
+def _state_params(offer):
+    building = offer.get('building') or {}
+    params = {
+        'Общая площадь': _number(offer.get('totalArea')),
+        'Жилая площадь': _number(offer.get('livingArea')),
+        'Площадь кухни': _number(offer.get('kitchenArea')),
+        'Высота потолков': _number(building.get('ceilingHeight') or offer.get('ceilingHeight')),
+        'Санузел': _counted([
+            (offer.get('combinedWcsCount') or 0, ('совмещенный', 'совмещенных', 'совмещенных')),
+            (offer.get('separateWcsCount') or 0, ('раздельный', 'раздельных', 'раздельных')),
+        ]),
+        'Балкон/лоджия': _counted([
+            (offer.get('balconiesCount') or 0, ('балкон', 'балкона', 'балконов')),
+            (offer.get('loggiasCount') or 0, ('лоджия', 'лоджии', 'лоджий')),
+        ]),
+        'Ремонт': REPAIR_TYPES.get(offer.get('repairType')),
+        'Вид из окон': WINDOWS_VIEW_TYPES.get(offer.get('windowsViewType')),
+        'Тип дома': MATERIAL_TYPES.get(building.get('materialType')),
+        'Парковка': PARKING_TYPES.get((building.get('parking') or {}).get('type')),
+        'Количество лифтов': _counted([
+            (building.get('passengerLiftsCount') or 0, ('пассажирский', 'пассажирских', 'пассажирских')),
+            (building.get('cargoLiftsCount') or 0, ('грузовой', 'грузовых', 'грузовых')),
+        ]),
+    }
+    if offer.get('floorNumber') and building.get('floorsCount'):
+        params['Этаж'] = f"{offer['floorNumber']} из {building['floorsCount']}"
+    if building.get('buildYear'):
+        params['Год постройки'] = str(building['buildYear'])
+    elif (building.get('deadline') or {}).get('year'):
+        params['Год сдачи'] = str(building['deadline']['year'])
+    category = offer.get('category') or ''
+    if category:
+        params['Тип жилья'] = 'Новостройка' if category.startswith('newBuilding') else 'Вторичка'
+    params = {key: value for key, value in params.items() if value}
+    return params or None
+
+
+def extract_from_state(state):
+    """
+    Заполняет словарь результата (те же ключи, что и parser_cian.func.extract_listing) из JSON-состояния.
+    Поля, которые из состояния получить нельзя, остаются None - их заполняют get_* по разметке.
+    """
+    result = {}
+    try:
+        offer = state['offerData']['offer']
+        geo = offer.get('geo') or {}
+        terms = offer.get('bargainTerms') or {}
+
+        result['title'] = offer.get('title') or None
+
+        address_parts = [item.get('fullName') or item.get('name') for item in geo.get('address') or []]
+        result['adress'] = ', '.join(part for part in address_parts if part) or None
+
+        price = terms.get('priceRur') or terms.get('price')
+        result['price'] = str(int(price)) if price else None
+
+        offer_facts = {}
+        total_area = offer.get('totalArea')
+        if price and total_area and float(total_area) > 0:
+            offer_facts['Цена за метр'] = str(round(price / float(total_area)))
+        if terms.get('saleType') in SALE_TYPES:
+            offer_facts['Условия сделки'] = SALE_TYPES[terms['saleType']]
+        if terms.get('mortgageAllowed') is not None:
+            offer_facts['Ипотека'] = 'возможна' if terms['mortgageAllowed'] else 'невозможна'
+        result['offer'] = offer_facts or None
+
+        metro = []
+        for underground in geo.get('undergrounds') or []:
+            if not underground.get('name'):
+                continue
+            station = {
+                'station': underground['name'],
+                'method': 'пешком' if underground.get('transportType') == 'walk' else 'автомобилем',
+            }
+            # Время до станции есть не у всех объявлений: без него ключ 'time' не заполняется
+            if underground.get('time') is not None:
+                station['time'] = f"{underground['time']} мин."
+            metro.append(station)
+        result['metro'] = metro or None
+
+        result['params'] = _state_params(offer)
+
+        description = (offer.get('description') or '').strip()
+        result['description'] = description.replace('\n', '<br>') or None
+
+        photos = [photo.get('thumbnail2Url') or photo.get('fullUrl') for photo in offer.get('photos') or []]
+        result['images_links'] = [photo for photo in photos if photo] or None
+    except (KeyError, TypeError, ValueError, AttributeError) as _ex:
+        printer(f'[state] Ошибка разбора состояния страницы: {_ex}', kind='warning')
+        return {}
+
+    printer(f"[state] Из JSON-состояния получены поля: {[k for k, v in result.items() if v is not None]}",
+            kind='info')
+    return result
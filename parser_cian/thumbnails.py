@@ -0,0 +1,59 @@
+import os
+import uuid
+from PIL import Image, ImageOps
+from servise import printer
+from settings import REPORT_IMAGE_WIDTH, REPORT_IMAGE_DPI, REPORT_IMAGE_QUALITY
+from parser_cian import image_store
+
+# Фотография в отчёте занимает REPORT_IMAGE_WIDTH CSS-пикселей (96 на дюйм);
+# для печати с плотностью REPORT_IMAGE_DPI хватает во столько раз больше пикселей исходника.
+TARGET_WIDTH = round(REPORT_IMAGE_WIDTH * REPORT_IMAGE_DPI / 96)
+
+
+def thumbnail_path(img_path):
+    """downloads/_store/2451958729-1.jpg -> downloads/_store/2451958729-1.w560q80.jpg (рядом с оригиналом)."""
+    root, _ = os.path.splitext(img_path)
+    return f'{root}.w{TARGET_WIDTH}q{REPORT_IMAGE_QUALITY}.jpg'
+
+
+def report_thumbnail(img_path):
+    """
+    Возвращает путь к уменьшенной копии фотографии для отчёта.
+
+    wkhtmltopdf показывает фотографию шириной REPORT_IMAGE_WIDTH, а оригинал -1.jpg в несколько раз больше:
+    он целиком декодируется и встраивается в PDF. Копия уменьшается до TARGET_WIDTH пикселей по ширине
+    и пережимается в JPEG с качеством REPORT_IMAGE_QUALITY. Готовая копия переиспользуется, пока она
+    не старше оригинала. Если оригинал уже не больше нужного размера или обработка не удалась,
+    возвращается путь к оригиналу.
+    """
+    if not img_path or not os.path.exists(img_path):
+        return img_path
+    # Копию кладём рядом с файлом в хранилище, чтобы она тоже была общей для всех объявлений
+    img_path = image_store.lookup(os.path.basename(img_path)) or img_path
+
+    target = thumbnail_path(img_path)
+    if os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(img_path):
+        return target
+
+    part_path = f'{target}.{uuid.uuid4().hex}.part'
+    try:
+        with Image.open(img_path) as image:
+            if image.width <= TARGET_WIDTH:
+                return img_path
+            # draft() просит декодер JPEG сразу уменьшить картинку кратно 1/2..1/8 - дешевле, чем декодировать целиком
+            image.draft('RGB', (TARGET_WIDTH, image.height * TARGET_WIDTH // image.width))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            height = round(image.height * TARGET_WIDTH / image.width)
+            image = image.resize((TARGET_WIDTH, height), Image.LANCZOS)
+            image.save(part_path, 'JPEG', quality=REPORT_IMAGE_QUALITY, optimize=True, progressive=True)
+        os.replace(part_path, target)
+    except Exception as _ex:
+        printer(f'[thumbnails] Не удалось уменьшить {img_path}: {_ex}', kind='error')
+        return img_path
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    printer(f'[thumbnails] {os.path.basename(img_path)}: {os.path.getsize(img_path) // 1024} КБ -> '
+            f'{os.path.getsize(target) // 1024} КБ', kind='info')
+    return target
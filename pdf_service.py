@@ -0,0 +1,128 @@
+import asyncio
+import collections
+import time
+from servise import printer
+from settings import PDF_WORKERS, PDF_QUEUE_SIZE, PDF_TIMEOUT
+from PDF_creater import pdf_command, check_pdf
+
+
+class PdfRenderService:
+    """
+    Сборка PDF в боте: очередь заданий и фиксированное число воркеров, каждый запускает по одному wkhtmltopdf.
+
+    Раньше каждый отчёт запускал свой процесс wkhtmltopdf в пуле потоков, и при наплыве запросов
+    десятки тяжёлых процессов Qt одновременно делили процессор и память. Здесь одновременно работает
+    не больше workers процессов, остальные задания ждут в очереди размером queue_size; когда очередь
+    заполнена, render() ждёт свободного места (обратное давление на обработчики сообщений).
+    Процесс, не уложившийся в timeout секунд, убивается.
+
+    HTML отчёта передаётся wkhtmltopdf через stdin, готовый PDF читается из stdout: промежуточных
+    файлов на диске нет (заголовок и подвал - общие файлы профиля брендинга, см. create_header_and_footer).
+
+    Для каждого задания замеряются ожидание в очереди и время сборки, сводку возвращает stats().
+    Воркеры запускаются при первом вызове render() на работающем event loop.
+    """
+
+    def __init__(self, workers=PDF_WORKERS, queue_size=PDF_QUEUE_SIZE, timeout=PDF_TIMEOUT, name='pdf_service'):
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.name = name
+        self._queue = None
+        self._tasks = []
+        self._counters = {'done': 0, 'failed': 0, 'timeout': 0}
+        # последние замеры в секундах: ожидание в очереди и сборка
+        self._waits = collections.deque(maxlen=200)
+        self._renders = collections.deque(maxlen=200)
+
+    def _start(self):
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.ensure_future(self._worker(number)) for number in range(self.workers)]
+            printer(f'[{self.name}] Запущено воркеров wkhtmltopdf: {self.workers}, очередь до {self.queue_size}',
+                    kind='info')
+
+    async def render(self, html, header_index, footer_index):
+        """Ставит HTML отчёта в очередь и ждёт PDF. Возвращает содержимое PDF (bytes) или None при ошибке."""
+        self._start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((html, header_index, footer_index, time.perf_counter(), future))
+        return await future
+
+    async def _worker(self, number):
+        while True:
+            html, header_index, footer_index, queued, future = await self._queue.get()
+            try:
+                if not future.cancelled():
+                    waited = time.perf_counter() - queued
+                    self._waits.append(waited)
+                    result = await self._run(html, header_index, footer_index, waited)
+                    if not future.cancelled():
+                        future.set_result(result)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, html, header_index, footer_index, waited):
+        """Один запуск wkhtmltopdf (stdin -> stdout) с таймаутом. Возвращает PDF (bytes) или None."""
+        started = time.perf_counter()
+        process = None
+        try:
+            args = pdf_command(None, header_index, footer_index)
+            process = await asyncio.create_subprocess_exec(
+                *args, stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            pdf, stderr = await asyncio.wait_for(process.communicate(html.encode('utf-8')), timeout=self.timeout)
+            check_pdf(pdf[:4], process.returncode, stderr)
+        except asyncio.TimeoutError:
+            self._counters['timeout'] += 1
+            printer(f'[{self.name}] wkhtmltopdf не уложился в {self.timeout} сек. и остановлен', kind='error')
+            return None
+        except Exception as _ex:
+            self._counters['failed'] += 1
+            printer(f'[{self.name}] {_ex}', kind='error')
+            return None
+        finally:
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+
+        rendered = time.perf_counter() - started
+        self._renders.append(rendered)
+        self._counters['done'] += 1
+        printer(f'[{self.name}] PDF {len(pdf) // 1024} КБ: ожидание в очереди {waited:.2f} сек., '
+                f'сборка {rendered:.2f} сек.', kind='info')
+        return pdf
+
+    def stats(self):
+        """Счётчики заданий, длина очереди и время ожидания/сборки (среднее и максимум по последним заданиям)."""
+        def summary(values):
+            values = list(values)
+            return {'avg': sum(values) / len(values) if values else 0.0, 'max': max(values, default=0.0)}
+
+        return {
+            **self._counters,
+            'queued': self._queue.qsize() if self._queue is not None else 0,
+            'wait': summary(self._waits),
+            'render': summary(self._renders),
+        }
+
+    async def close(self):
+        """Останавливает воркеров; задания, ещё ждущие в очереди, отменяются."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._queue is not None:
+            while not self._queue.empty():
+                *_, future = self._queue.get_nowait()
+                if not future.done():
+                    future.cancel()
+        self._queue = None
+        self._tasks = []
+
+
+# Общий для бота сервис сборки PDF
+pdf_service = PdfRenderService()
@@ -0,0 +1,108 @@
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from servise import printer
+from settings import RATE_LIMITS, RATE_LIMIT_BACKOFF, RATE_LIMIT_MIN_RPS
+
+# Ответы, на которые лимитер реагирует снижением скорости
+THROTTLE_STATUSES = (429, 503)
+# Во сколько раз восстанавливается скорость после каждого успешного ответа
+RECOVERY_FACTOR = 1.1
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости запросов к одному хосту по алгоритму token bucket.
+
+    Корзина вмещает burst токенов и пополняется со скоростью rate токенов в секунду,
+    поэтому короткие всплески до burst запросов проходят без ожидания, а средняя скорость
+    не превышает rate. На ответы 429/503 скорость снижается в RATE_LIMIT_BACKOFF раз
+    (не ниже RATE_LIMIT_MIN_RPS) с учётом Retry-After, а успешные ответы постепенно
+    возвращают её к исходной.
+
+    Один объект безопасно использовать и из потоков (acquire), и из event loop (acquire_async).
+    """
+
+    def __init__(self, host, rate, burst):
+        self.host = host
+        self.base_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = max(1, int(burst))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Забирает один токен (при необходимости в долг) и возвращает, сколько секунд нужно подождать."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.blocked_until - now)
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def feedback(self, status_code, retry_after=None):
+        """Подстраивает скорость по коду ответа сервера."""
+        with self._lock:
+            if status_code in THROTTLE_STATUSES:
+                self.rate = max(RATE_LIMIT_MIN_RPS, self.rate / RATE_LIMIT_BACKOFF)
+                pause = _parse_retry_after(retry_after)
+                if pause is None:
+                    pause = 1 / self.rate
+                self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+                # Сбрасываем накопленный запас, чтобы после паузы не было нового всплеска
+                self.tokens = min(self.tokens, 0.0)
+                printer(f'[rate_limiter] {self.host}: ответ {status_code}, скорость снижена до '
+                        f'{self.rate:.2f} запр./сек., пауза {pause:.1f} сек.', kind='warning')
+            elif status_code < 400 and self.rate < self.base_rate:
+                self.rate = min(self.base_rate, self.rate * RECOVERY_FACTOR)
+
+
+def _parse_retry_after(value):
+    """Retry-After бывает числом секунд или HTTP-датой. Возвращает секунды или None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(url):
+    """
+    Возвращает общий лимитер для хоста из URL или None, если для хоста лимит не задан
+    (см. RATE_LIMITS в settings).
+    """
+    host = urlsplit(url).hostname
+    if host not in RATE_LIMITS:
+        return None
+    limiter = _limiters.get(host)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(host)
+            if limiter is None:
+                rate, burst = RATE_LIMITS[host]
+                limiter = _limiters[host] = TokenBucket(host, rate, burst)
+    return limiter
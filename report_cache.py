@@ -0,0 +1,98 @@
+import collections
+import hashlib
+import json
+import threading
+from servise import printer
+from settings import REPORT_CACHE_MB, REPORT_IMAGES, REPORT_IMAGE_WIDTH, REPORT_IMAGE_DPI, REPORT_IMAGE_QUALITY
+from create_cian import REPORT_TEMPLATE_PATH, REPORT_PLACEHOLDERS
+from report_template import load_template
+
+# Кэш готовых PDF-отчётов бота в памяти процесса.
+# Ключ - хэш нормализованного словаря результата, версии шаблона отчёта и профиля брендинга:
+# одинаковое объявление с теми же контактами риелтора и тем же шаблоном даёт тот же PDF,
+# и повторный запрос отправляется без сборки HTML и без запуска wkhtmltopdf.
+# Из кэша отдаётся тот же файл целиком: строка «Отчёт сформирован», число просмотров и имя файла
+# (с меткой времени) остаются такими, какими были при первой сборке - отчёт честно показывает,
+# когда он был собран, и совпадает с документом, уже загруженным в Telegram (telegram_files).
+# Размер кэша ограничен REPORT_CACHE_MB мегабайтами, при переполнении вытесняются
+# давно не запрошенные отчёты (LRU).
+
+# Поля результата, которые меняются при каждой загрузке страницы и не должны влиять на ключ:
+# счётчики просмотров, дата обновления, пересчитанная относительно текущего дня, и служебные поля бота
+VOLATILE_FIELDS = ('URL', 'cian_number')
+VOLATILE_METADATA_FIELDS = ('views_stats', 'всего_просмотров', 'просмотров_сегодня', 'уникальных_просмотров',
+                            'updated_datetime')
+
+_entries = collections.OrderedDict()  # ключ -> RenderedReport
+_size = 0
+_stats = {'hit': 0, 'miss': 0, 'evicted': 0}
+_lock = threading.Lock()
+
+
+def normalize(result):
+    """
+    Копия результата разбора (или списка результатов для сравнения) без изменчивых полей VOLATILE_FIELDS
+    и VOLATILE_METADATA_FIELDS: по ней считается ключ, чтобы повторный запрос неизменившегося объявления
+    попадал в кэш, даже если у него прибавились просмотры.
+    """
+    if isinstance(result, list):
+        return [normalize(item) for item in result]
+    normalized = {key: value for key, value in result.items() if key not in VOLATILE_FIELDS}
+    if isinstance(normalized.get('offer_metadata'), dict):
+        normalized['offer_metadata'] = {key: value for key, value in normalized['offer_metadata'].items()
+                                        if key not in VOLATILE_METADATA_FIELDS}
+    return normalized
+
+
+def report_key(result, header_index):
+    """
+    Ключ отчёта по словарю результата разбора (см. normalize()).
+    header_index - путь к заголовку из create_header_and_footer(): каталог назван хэшем профиля брендинга,
+    шаблонов заголовка и подвала, поэтому смена контактов даёт другой ключ.
+    В ключ входят и настройки фотографий отчёта (REPORT_IMAGES и REPORT_IMAGE_*): после их смены
+    file_id из telegram_files не отдают PDF со старыми фотографиями.
+    """
+    template = load_template(REPORT_TEMPLATE_PATH, REPORT_PLACEHOLDERS)
+    template.reload()
+    normalized = json.dumps(normalize(result), ensure_ascii=False, sort_keys=True, default=str)
+    images = f'{REPORT_IMAGES} {REPORT_IMAGE_WIDTH} {REPORT_IMAGE_DPI} {REPORT_IMAGE_QUALITY}'
+    source = f'{normalized}\n{template.mtime}\n{header_index}\n{images}'
+    return hashlib.sha256(source.encode('utf8')).hexdigest()
+
+
+def get(key):
+    """Отчёт из кэша (RenderedReport) или None. Учитывает попадание или промах."""
+    with _lock:
+        report = _entries.get(key)
+        if report is None:
+            _stats['miss'] += 1
+        else:
+            _entries.move_to_end(key)
+            _stats['hit'] += 1
+        snapshot = dict(_stats)
+    printer(f"[report_cache] {'hit' if report else 'miss'} {key[:12]} (всего: {snapshot})", kind='info')
+    return report
+
+
+def put(key, report):
+    """Кладёт отчёт в кэш и вытесняет самые старые записи, пока кэш не уложится в REPORT_CACHE_MB."""
+    global _size
+    limit = REPORT_CACHE_MB * 1024 * 1024
+    if len(report.pdf) > limit:
+        return
+    with _lock:
+        previous = _entries.pop(key, None)
+        if previous is not None:
+            _size -= len(previous.pdf)
+        _entries[key] = report
+        _size += len(report.pdf)
+        while _size > limit:
+            _, evicted = _entries.popitem(last=False)
+            _size -= len(evicted.pdf)
+            _stats['evicted'] += 1
+
+
+def stats():
+    """Счётчики кэша с запуска процесса, число отчётов и их общий размер в байтах."""
+    with _lock:
+        return {**_stats, 'entries': len(_entries), 'bytes': _size}
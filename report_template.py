@@ -0,0 +1,69 @@
+import os
+import re
+import threading
+from servise import printer
+
+
+class CompiledTemplate:
+    """
+    HTML-шаблон отчёта, заранее разобранный на литеральные куски и слоты-плейсхолдеры.
+
+    Раньше каждый отчёт читал шаблон с диска и делал ~45 вызовов str.replace(): каждый копирует
+    весь документ, а вставленные значения проходят через следующие замены (описание со словом
+    'МЕТРО' получало внутрь список станций). Здесь шаблон один раз разбивается регулярным
+    выражением из всех плейсхолдеров (длинные раньше коротких, только целые слова),
+    а render() собирает документ за один проход.
+
+    Файл перечитывается и разбирается заново, если изменилось его время модификации.
+    """
+
+    def __init__(self, path, placeholders):
+        self.path = path
+        self.placeholders = tuple(placeholders)
+        names = sorted(self.placeholders, key=len, reverse=True)
+        self.pattern = re.compile(r'(?<!\w)(' + '|'.join(map(re.escape, names)) + r')(?!\w)')
+        self.mtime = None
+        self.parts = ()
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Читает и разбирает шаблон, если файл изменился с прошлой загрузки."""
+        mtime = os.path.getmtime(self.path)
+        if mtime == self.mtime:
+            return
+        with self._lock:
+            if mtime == self.mtime:
+                return
+            with open(file=self.path, mode='r', encoding='utf8') as f:
+                text = f.read()
+            # split с группой даёт [литерал, слот, литерал, слот, ..., литерал]: слоты на нечётных местах
+            parts = self.pattern.split(text)
+            self.parts = tuple((part, index % 2 == 1) for index, part in enumerate(parts) if part)
+            self.mtime = mtime
+            printer(f'[report_template] Загружен шаблон {os.path.basename(self.path)}: '
+                    f'{sum(is_slot for _, is_slot in self.parts)} слотов', kind='info')
+
+    def render(self, values):
+        """
+        Подставляет values (плейсхолдер -> значение) за один проход.
+        Плейсхолдер без значения остаётся в тексте как есть.
+        """
+        self.reload()
+        return ''.join(str(values.get(part, part)) if is_slot else part for part, is_slot in self.parts)
+
+
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+def load_template(path, placeholders):
+    """Общий для процесса CompiledTemplate для файла path с данным набором плейсхолдеров."""
+    key = (path, tuple(placeholders))
+    template = _templates.get(key)
+    if template is None:
+        with _templates_lock:
+            template = _templates.get(key)
+            if template is None:
+                template = _templates[key] = CompiledTemplate(path, placeholders)
+    return template
@@ -1,6 +1,7 @@
 from settings import log_dir_absolute
 import datetime
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -14,3 +15,19 @@ def printer(message, kind='info'):
         if kind != 'info':
             with open(file=os.path.join(log_dir_absolute, kind+'txt'), mode='a', encoding='utf8') as file:
                 file.write(f'[{dt}]\t[{kind.upper()}]\t{message}\n')
+
+
+def write_atomic(path, text):
+    """
+    Записывает text в path целиком или не записывает вовсе: сначала во временный файл в том же каталоге,
+    затем os.replace, поэтому параллельный читатель не увидит половину файла. У каждой записи свой
+    временный файл (mkstemp): два одновременных писателя одного пути не пишут в один .tmp.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
+    try:
+        with open(fd, mode='w', encoding='utf8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
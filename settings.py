@@ -70,7 +70,81 @@ os.makedirs(templates_dir_absolute, exist_ok=True)
 # Загружаем переменные окружения
 load_dotenv()
 
+
+def env_flag(name, default=False):
+    """
+    Логическая настройка: '1', 'true', 'yes' или 'on' (без учёта регистра) - включено, всё остальное - выключено.
+    Если переменная не задана или пуста, возвращается default.
+    """
+    value = os.getenv(name, '').strip().lower()
+    if not value:
+        return default
+    return value in ('1', 'true', 'yes', 'on')
+
+
 # Переменная для режима отладки
 # True - запуск бота в режиме отладки для однократного запуска
 # False - запуск бота в режиме реальной работы для периодического парсинга сайта
 DEBUG = os.getenv("DEBUG", False)
+
+# Параметры общего HTTP-клиента (пул соединений с keep-alive к www.cian.ru и images.cdn-cian.ru)
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", 4))  # сколько хостов держим в пуле
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", 8))  # максимум соединений на один хост
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))  # таймаут установки соединения, сек.
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 20))  # таймаут чтения ответа, сек.
+HTTP_KEEPALIVE_TIMEOUT = float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", 60))  # сколько держать простаивающее соединение (aiohttp), сек.
+
+
+# Кэш исходных HTML-страниц объявлений (downloads/<cian_number>/page.html)
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL", 600))  # сколько секунд страница считается свежей (0 - всегда перепроверять)
+PAGE_CACHE_OFFLINE = env_flag("PAGE_CACHE_OFFLINE")  # брать страницу только из кэша, не обращаясь к Циан
+
+# Ограничение скорости запросов к Циан (token bucket на каждый хост): запросов в секунду и размер всплеска
+RATE_LIMIT_PAGES_RPS = float(os.getenv("RATE_LIMIT_PAGES_RPS", 1))
+RATE_LIMIT_PAGES_BURST = int(os.getenv("RATE_LIMIT_PAGES_BURST", 3))
+RATE_LIMIT_IMAGES_RPS = float(os.getenv("RATE_LIMIT_IMAGES_RPS", 5))
+RATE_LIMIT_IMAGES_BURST = int(os.getenv("RATE_LIMIT_IMAGES_BURST", 10))
+RATE_LIMIT_BACKOFF = float(os.getenv("RATE_LIMIT_BACKOFF", 2))  # во сколько раз снижать скорость при ответе 429/503
+RATE_LIMIT_MIN_RPS = float(os.getenv("RATE_LIMIT_MIN_RPS", 0.1))  # нижняя граница скорости после снижений
+RATE_LIMITS = {
+    'www.cian.ru': (RATE_LIMIT_PAGES_RPS, RATE_LIMIT_PAGES_BURST),
+    'images.cdn-cian.ru': (RATE_LIMIT_IMAGES_RPS, RATE_LIMIT_IMAGES_BURST),
+}
+
+# Построитель дерева BeautifulSoup для страниц объявлений: 'lxml' (C, быстрый), 'html.parser' (встроенный), 'html5lib'
+HTML_PARSER = os.getenv("HTML_PARSER", "lxml")
+# Частичный разбор страницы: строить дерево только из блоков, которые читают get_* (0 - разбирать страницу целиком)
+PARTIAL_PARSE = env_flag("PARTIAL_PARSE", True)
+
+# Загрузка фотографий объявления
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", 6))  # сколько фотографий качать одновременно (не больше HTTP_POOL_MAXSIZE)
+IMAGE_CHUNK_SIZE = int(os.getenv("IMAGE_CHUNK_SIZE", 64 * 1024))  # размер куска при потоковой записи на диск, байт
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", os.path.join(downloads_dir_absolute, "_store"))  # общее хранилище фотографий всех объявлений
+REPORT_IMAGES = int(os.getenv("REPORT_IMAGES", 3))  # сколько фотографий попадает в отчёт (их качаем сразу)
+FULL_PHOTO_SET = env_flag("FULL_PHOTO_SET")  # догружать остальные фотографии объявления в фоне
+
+# Фотографии в отчёте: ширина в отчёте (CSS px), плотность печати и качество JPEG уменьшенной копии (нужен Pillow)
+REPORT_IMAGE_WIDTH = int(os.getenv("REPORT_IMAGE_WIDTH", 280))
+REPORT_IMAGE_DPI = int(os.getenv("REPORT_IMAGE_DPI", 192))  # 96 - как на экране, 192 - чётко при печати
+REPORT_IMAGE_QUALITY = int(os.getenv("REPORT_IMAGE_QUALITY", 80))
+
+# Общий каталог для заголовка и подвала отчёта: они одинаковы для всех объявлений одного профиля брендинга
+BRANDING_DIR = os.getenv("BRANDING_DIR", os.path.join(downloads_dir_absolute, "_branding"))
+
+# Сборка PDF (wkhtmltopdf): сколько процессов работает одновременно, сколько заданий может ждать в очереди бота
+# и через сколько секунд зависший процесс принудительно завершается
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+PDF_QUEUE_SIZE = int(os.getenv("PDF_QUEUE_SIZE", 20))
+PDF_TIMEOUT = float(os.getenv("PDF_TIMEOUT", 60))
+ARCHIVE_REPORTS = env_flag("ARCHIVE_REPORTS")  # сохранять HTML и PDF отчётов бота в downloads/<cian_number>/
+REPORT_CACHE_MB = float(os.getenv("REPORT_CACHE_MB", 100))  # сколько мегабайт готовых PDF держать в памяти для повторных запросов
+TELEGRAM_FILE_IDS_PATH = os.getenv("TELEGRAM_FILE_IDS_PATH", os.path.join(downloads_dir_absolute, "_telegram_file_ids.json"))  # file_id загруженных в Telegram отчётов
+TELEGRAM_FILE_IDS_MAX = int(os.getenv("TELEGRAM_FILE_IDS_MAX", 5000))  # сколько file_id хранить, старые забываются
+TELEGRAM_FILE_IDS_SAVE_DELAY = float(os.getenv("TELEGRAM_FILE_IDS_SAVE_DELAY", 5))  # через сколько секунд после изменения сохранять файл
+
+# Очередь заданий бота: сколько объявлений обрабатывается одновременно, сколько из них может быть
+# от одного пользователя и сколько заданий может ждать в очереди (админ-чат идёт вне очереди)
+JOBS_MAX_CONCURRENT = int(os.getenv("JOBS_MAX_CONCURRENT", 4))
+JOBS_PER_USER = int(os.getenv("JOBS_PER_USER", 1))
+JOBS_PER_BATCH = int(os.getenv("JOBS_PER_BATCH", 3))  # сколько ссылок из одного сообщения-списка обрабатывается одновременно
+JOBS_MAX_QUEUED = int(os.getenv("JOBS_MAX_QUEUED", 50))
@@ -0,0 +1,41 @@
+import asyncio
+from servise import printer
+
+
+class SingleFlight:
+    """
+    Объединяет одновременные запросы с одинаковым ключом в одну задачу.
+
+    Первый вызов run(key, ...) запускает корутину, все последующие вызовы с тем же ключом,
+    пока задача не завершилась, ждут её же и получают тот же результат (или то же исключение).
+    После завершения ключ освобождается, и следующий запрос снова выполнит работу.
+    """
+
+    def __init__(self, name='singleflight'):
+        self.name = name
+        self._inflight = {}
+
+    async def run(self, key, coro_factory):
+        """
+        Выполняет coro_factory() для ключа key или присоединяется к уже идущему выполнению.
+        coro_factory - функция без аргументов, возвращающая корутину (вызывается только для первого запроса).
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            printer(f'[{self.name}] Запрос {key} присоединён к уже выполняющейся задаче', kind='info')
+        # shield: отмена одного из ожидающих (например, пользователь ушёл) не отменяет общую задачу
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    def __contains__(self, key):
+        return key in self._inflight
+
+    def __len__(self):
+        return len(self._inflight)
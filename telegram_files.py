@@ -0,0 +1,107 @@
+import collections
+import json
+import os
+import threading
+from servise import printer
+from settings import TELEGRAM_FILE_IDS_PATH, TELEGRAM_FILE_IDS_MAX, TELEGRAM_FILE_IDS_SAVE_DELAY
+
+# Соответствие ключа отчёта (report_cache.report_key) и file_id документа в Telegram.
+# После первой загрузки PDF Telegram возвращает file_id, по которому тот же файл можно отправить
+# в любой чат без повторной загрузки байтов: копия администратору и повторные запросы того же
+# объявления уходят по file_id. Соответствие хранится в JSON-файле TELEGRAM_FILE_IDS_PATH
+# и переживает перезапуск бота.
+# Хранится не больше TELEGRAM_FILE_IDS_MAX записей: при переполнении забываются давно не
+# отправлявшиеся отчёты. Файл перезаписывается не на каждое изменение и не в event loop бота,
+# а фоновым потоком через TELEGRAM_FILE_IDS_SAVE_DELAY секунд после первого несохранённого изменения.
+
+_file_ids = None
+_lock = threading.Lock()
+_save_lock = threading.Lock()  # записи файла идут по одной и в порядке снимков
+_save_timer = None
+
+
+def _load():
+    global _file_ids
+    if _file_ids is None:
+        try:
+            with open(TELEGRAM_FILE_IDS_PATH, mode='r', encoding='utf8') as f:
+                _file_ids = collections.OrderedDict(json.load(f))
+        except FileNotFoundError:
+            _file_ids = collections.OrderedDict()
+        except (OSError, ValueError) as _ex:
+            printer(f'[telegram_files] Не удалось прочитать {TELEGRAM_FILE_IDS_PATH}: {_ex}', kind='error')
+            _file_ids = collections.OrderedDict()
+    return _file_ids
+
+
+def preload():
+    """Читает TELEGRAM_FILE_IDS_PATH при запуске бота, чтобы первый get() не читал файл в event loop."""
+    with _lock:
+        _load()
+
+
+def _schedule_save():
+    # Вызывается под _lock: несколько изменений подряд сохраняются одной записью файла
+    global _save_timer
+    if _save_timer is None:
+        _save_timer = threading.Timer(TELEGRAM_FILE_IDS_SAVE_DELAY, flush)
+        _save_timer.daemon = True
+        _save_timer.start()
+
+
+def flush():
+    """Записывает несохранённые изменения в TELEGRAM_FILE_IDS_PATH (вызывается таймером и при остановке бота)."""
+    global _save_timer
+    with _save_lock:
+        # Копия снимается под _lock, а файл пишется без него: get() в event loop не ждёт диска
+        with _lock:
+            if _save_timer is not None:
+                _save_timer.cancel()
+                _save_timer = None
+            if _file_ids is None:
+                return
+            snapshot = dict(_file_ids)
+        # Пишем во временный файл и переименовываем, чтобы при сбое не остался обрезанный JSON
+        tmp_path = f'{TELEGRAM_FILE_IDS_PATH}.tmp'
+        try:
+            os.makedirs(os.path.dirname(TELEGRAM_FILE_IDS_PATH) or '.', exist_ok=True)
+            with open(tmp_path, mode='w', encoding='utf8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, TELEGRAM_FILE_IDS_PATH)
+        except OSError as _ex:
+            printer(f'[telegram_files] Не удалось сохранить {TELEGRAM_FILE_IDS_PATH}: {_ex}', kind='error')
+
+
+def get(key):
+    """file_id уже загруженного отчёта или None."""
+    if not key:
+        return None
+    with _lock:
+        file_ids = _load()
+        file_id = file_ids.get(key)
+        if file_id:
+            file_ids.move_to_end(key)
+        return file_id
+
+
+def put(key, file_id):
+    """Запоминает file_id отчёта и забывает самые старые записи сверх TELEGRAM_FILE_IDS_MAX."""
+    if not key or not file_id:
+        return
+    with _lock:
+        file_ids = _load()
+        if file_ids.get(key) == file_id:
+            file_ids.move_to_end(key)
+            return
+        file_ids[key] = file_id
+        file_ids.move_to_end(key)
+        while len(file_ids) > max(1, TELEGRAM_FILE_IDS_MAX):
+            file_ids.popitem(last=False)
+        _schedule_save()
+
+
+def forget(key):
+    """Удаляет file_id, который Telegram больше не принимает."""
+    with _lock:
+        if _load().pop(key, None) is not None:
+            _schedule_save()